@@ -1,16 +1,22 @@
+import hashlib
+import hmac
 import os
+import time
 import warnings
-from datetime import datetime, timedelta, timezone
+from datetime import timedelta
 from typing import Annotated, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from jose import JWTError, jwt
+from jose import JWTError, jwk, jwt
 from passlib.context import CryptContext
 from pydantic import BaseModel, EmailStr, Field
+from sqlalchemy import bindparam, select
 from sqlalchemy.orm import Session
 
-from database import get_db
+from cache_utils import TTLCache
+from database import get_read_db
 from models import RoleEnum, User
 from permissions import has_perm
 
@@ -25,13 +31,37 @@ if not SECRET_KEY:
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
+# Chiave HMAC e lista algoritmi costruite una volta: passando un oggetto Key
+# a jose si evitano il tentativo di json.loads sulla chiave e la creazione
+# di una nuova HMACKey a ogni firma o verifica.
+_JWT_KEY = jwk.construct(SECRET_KEY, ALGORITHM)
+_JWT_ALGORITHMS = [ALGORITHM]
+
 pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
+# Verifiche riuscite recenti: pbkdf2 costa centinaia di migliaia di round
+# SHA-256, un login ripetuto con la stessa password non deve rifarli. Si
+# memorizzano solo gli esiti positivi, con chiave HMAC (mai la password).
+_PASSWORD_VERIFY_CACHE = TTLCache(max_entries=1024)
+PASSWORD_VERIFY_CACHE_TTL_SECONDS = 300
+
+def _password_cache_key(plain_password: str, hashed_password: str) -> str:
+    message = f"{hashed_password}\0{plain_password}".encode()
+    return hmac.new(SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    cache_key = _password_cache_key(plain_password, hashed_password)
+    if _PASSWORD_VERIFY_CACHE.get(cache_key):
+        return True
+    if not pwd_context.verify(plain_password, hashed_password):
+        return False
+    _PASSWORD_VERIFY_CACHE.set(
+        cache_key, True, PASSWORD_VERIFY_CACHE_TTL_SECONDS
+    )
+    return True
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
@@ -47,8 +77,27 @@ class LoginRequest(BaseModel):
     email: EmailStr
     password: str
 
+# Utenti per email, letti dalle sessioni di sola lettura: login, dipendenze
+# di autenticazione e homepage non ripetono la SELECT per gli account attivi.
+# Svuotata insieme alla cache utenti da invalidate_current_user_cache().
+_USER_BY_EMAIL_CACHE = TTLCache(max_entries=1024)
+USER_BY_EMAIL_CACHE_TTL_SECONDS = 30
+
+# Lookup per email eseguito a ogni richiesta autenticata senza cache: lo
+# statement viene costruito una sola volta e riusato con il parametro.
+_USER_BY_EMAIL_STMT = select(User).where(User.email == bindparam("email")).limit(1)
+
 def get_user_by_email(db: Session, email: str) -> Optional[User]:
-    return db.query(User).filter(User.email == email).first()
+    cached = _USER_BY_EMAIL_CACHE.get(email)
+    if isinstance(cached, User):
+        return cached
+    user = db.scalars(_USER_BY_EMAIL_STMT, {"email": email}).first()
+    if user is not None:
+        # L'istanza in cache e' condivisa tra thread e richieste: la si stacca
+        # dalla sessione che l'ha caricata, cosi' non resta legata a lei.
+        db.expunge(user)
+        _USER_BY_EMAIL_CACHE.set(email, user, USER_BY_EMAIL_CACHE_TTL_SECONDS)
+    return user
 
 def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
     user = get_user_by_email(db, email=email)
@@ -60,30 +109,100 @@ def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + (
-        expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    # exp come timestamp intero: evita di costruire un datetime per token.
+    expire = int(
+        time.time()
+        + (
+            expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        ).total_seconds()
     )
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return jwt.encode(to_encode, _JWT_KEY, algorithm=ALGORITHM)
+
+# Utenti autenticati per token: evita decode JWT e SELECT a ogni richiesta.
+# Chiave = digest del token, come le altre cache dei token; va svuotata quando
+# cambiano ruolo, stato o password di un utente.
+_CURRENT_USER_CACHE = TTLCache(max_entries=2048)
+CURRENT_USER_CACHE_TTL_SECONDS = 30
+
+# Token rifiutati (firma errata, scaduti, senza sub): una richiesta ripetuta
+# con lo stesso token non rifa' la verifica HMAC. Chiave = digest del token.
+_INVALID_TOKEN_CACHE = TTLCache(max_entries=4096)
+INVALID_TOKEN_CACHE_TTL_SECONDS = 60
+
+def invalidate_current_user_cache() -> None:
+    _CURRENT_USER_CACHE.clear()
+    _USER_BY_EMAIL_CACHE.clear()
+
+def _token_digest(token: str) -> str:
+    return hashlib.blake2b(token.encode(), digest_size=16).hexdigest()
+
+# Payload dei token gia' verificati, validi fino al loro exp: la cache utenti
+# scade prima (30s) ma la firma non va riverificata a ogni rinnovo.
+_DECODED_TOKEN_CACHE = TTLCache(max_entries=2048)
+
+def decode_access_token(token: str) -> Optional[dict]:
+    """Verifica il JWT e ne restituisce il payload, o None se non valido."""
+    token_digest = _token_digest(token)
+    payload = _DECODED_TOKEN_CACHE.get(token_digest)
+    if payload is not None:
+        return payload
+    if _INVALID_TOKEN_CACHE.get(token_digest):
+        return None
+
+    try:
+        payload = jwt.decode(token, _JWT_KEY, algorithms=_JWT_ALGORITHMS)
+    except JWTError:
+        payload = None
+    if payload is None or payload.get("sub") is None:
+        _INVALID_TOKEN_CACHE.set(
+            token_digest, True, INVALID_TOKEN_CACHE_TTL_SECONDS
+        )
+        return None
+
+    expires_at = payload.get("exp")
+    if isinstance(expires_at, (int, float)):
+        ttl = expires_at - time.time()
+    else:
+        ttl = ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    if ttl > 0:
+        _DECODED_TOKEN_CACHE.set(token_digest, payload, ttl)
+    return payload
+
+async def _get_user_for_token(db: Session, token: str) -> Optional[User]:
+    token_digest = _token_digest(token)
+    cached = _CURRENT_USER_CACHE.get(token_digest)
+    if isinstance(cached, User):
+        return cached
+
+    payload = decode_access_token(token)
+    if payload is None:
+        return None
+    email: str = payload["sub"]
+
+    user = await run_in_threadpool(get_user_by_email, db, email)
+    if user is None:
+        return None
+
+    # Il token non deve sopravvivere in cache oltre la sua scadenza.
+    ttl = CURRENT_USER_CACHE_TTL_SECONDS
+    expires_at = payload.get("exp")
+    if isinstance(expires_at, (int, float)):
+        ttl = min(ttl, expires_at - time.time())
+    if ttl > 0:
+        _CURRENT_USER_CACHE.set(token_digest, user, ttl)
+    return user
 
 async def get_current_user(
     token: Annotated[str, Depends(oauth2_scheme)],
-    db: Annotated[Session, Depends(get_db)],
+    db: Annotated[Session, Depends(get_read_db, scope="function")],
 ) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Credenziali non valide o token mancante",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: Optional[str] = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-
-    user = get_user_by_email(db, email=email)
+    user = await _get_user_for_token(db, token)
     if user is None:
         raise credentials_exception
     return user
@@ -98,34 +217,28 @@ async def get_current_active_user(
         )
     return current_user
 
-async def get_current_user_html(
-    request: Request,
-    db: Annotated[Session, Depends(get_db)],
-) -> User:
-    redirect_exception = HTTPException(
-        status_code=status.HTTP_303_SEE_OTHER,
-        headers={"Location": "/login"},
-    )
-
+async def get_user_from_cookie(request: Request, db: Session) -> Optional[User]:
+    """Utente del cookie access_token (None se assente o non valido)."""
     cookie_token = request.cookies.get("access_token")
     if not cookie_token:
-        raise redirect_exception
+        return None
 
     token = cookie_token
     if token.startswith("Bearer "):
         token = token[len("Bearer ") :]
 
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: Optional[str] = payload.get("sub")
-        if email is None:
-            raise redirect_exception
-    except JWTError:
-        raise redirect_exception
+    return await _get_user_for_token(db, token)
 
-    user = get_user_by_email(db, email=email)
+async def get_current_user_html(
+    request: Request,
+    db: Annotated[Session, Depends(get_read_db, scope="function")],
+) -> User:
+    user = await get_user_from_cookie(request, db)
     if user is None:
-        raise redirect_exception
+        raise HTTPException(
+            status_code=status.HTTP_303_SEE_OTHER,
+            headers={"Location": "/login"},
+        )
     return user
 
 async def get_current_active_user_html(
@@ -164,9 +277,13 @@ def _generate_token_for_user(user: User) -> Token:
 @router.post("/token", response_model=Token)
 async def login_for_access_token_form(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    db: Annotated[Session, Depends(get_db)],
+    db: Annotated[Session, Depends(get_read_db, scope="function")],
 ):
-    user = authenticate_user(db, email=form_data.username, password=form_data.password)
+    # pbkdf2 blocca per decine di ms: la verifica gira nel threadpool per non
+    # fermare l'event loop (e le altre richieste) durante il login.
+    user = await run_in_threadpool(
+        authenticate_user, db, form_data.username, form_data.password
+    )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -180,9 +297,11 @@ async def login_for_access_token_form(
 @router.post("/login", response_model=Token)
 async def login_json(
     login_data: LoginRequest,
-    db: Annotated[Session, Depends(get_db)],
+    db: Annotated[Session, Depends(get_read_db, scope="function")],
 ):
-    user = authenticate_user(db, email=login_data.email, password=login_data.password)
+    user = await run_in_threadpool(
+        authenticate_user, db, login_data.email, login_data.password
+    )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
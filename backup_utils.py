@@ -2,8 +2,11 @@ from __future__ import annotations
 
 import os
 import sqlite3
+import time
+from contextlib import closing
 from dataclasses import dataclass
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 
 from sqlalchemy.engine import make_url
@@ -19,13 +22,30 @@ class BackupInfo:
     created_at: datetime
 
 
-def _resolve_backup_dir() -> Path:
-    backup_dir = os.getenv("BACKUP_DIR", "backups")
+# La directory viene creata una volta per valore di BACKUP_DIR: le chiamate
+# successive non ripetono expanduser e mkdir.
+@lru_cache(maxsize=4)
+def _ensure_backup_dir(backup_dir: str) -> Path:
     path = Path(backup_dir).expanduser()
     path.mkdir(parents=True, exist_ok=True)
     return path
 
 
+def _resolve_backup_dir() -> Path:
+    return _ensure_backup_dir(os.getenv("BACKUP_DIR", "backups"))
+
+
+def _resolve_pages_per_step() -> int:
+    # -1 (default) copia l'intero database in un solo sqlite3_backup_step:
+    # e' la modalita' piu' rapida. Un valore positivo copia a blocchi e
+    # lascia scrivere l'applicazione tra un passo e l'altro.
+    try:
+        return int(os.getenv("BACKUP_PAGES_PER_STEP", "-1"))
+    except ValueError:
+        return -1
+
+
+@lru_cache(maxsize=4)
 def _resolve_sqlite_path(db_url: str) -> Path:
     url = make_url(db_url)
     if url.drivername != "sqlite":
@@ -39,17 +59,24 @@ def create_database_backup() -> Path:
     db_url = os.getenv("DATABASE_URL", DATABASE_URL)
     db_path = _resolve_sqlite_path(db_url)
     backup_dir = _resolve_backup_dir()
-    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    timestamp = time.strftime("%Y%m%d_%H%M%S", time.gmtime())
     backup_name = f"backup_{timestamp}.sqlite3"
     backup_path = backup_dir / backup_name
 
-    src_conn = sqlite3.connect(db_path)
-    dst_conn = sqlite3.connect(backup_path)
-    try:
-        src_conn.backup(dst_conn)
-    finally:
-        dst_conn.close()
-        src_conn.close()
+    # Sorgente in sola lettura: con il database in WAL (PRAGMA impostati in
+    # database.py) la copia non prende lock di scrittura e le richieste
+    # possono continuare a fare commit durante il backup.
+    source_uri = f"{db_path.resolve().as_uri()}?mode=ro"
+    with closing(sqlite3.connect(source_uri, uri=True)) as src_conn:
+        if os.getenv("BACKUP_MODE", "").lower() == "vacuum":
+            # VACUUM INTO scrive in un solo passaggio una copia gia'
+            # compattata, senza pagine libere: piu' rapido della copia
+            # pagina per pagina sui database grandi e frammentati.
+            src_conn.execute("VACUUM INTO ?", (str(backup_path),))
+        else:
+            src_conn.execute("PRAGMA query_only=1")
+            with closing(sqlite3.connect(backup_path)) as dst_conn:
+                src_conn.backup(dst_conn, pages=_resolve_pages_per_step())
 
     return backup_path
 
@@ -57,27 +84,39 @@ def create_database_backup() -> Path:
 def list_backups() -> list[BackupInfo]:
     backup_dir = _resolve_backup_dir()
     backups: list[BackupInfo] = []
-    for path in backup_dir.glob("backup_*.sqlite3"):
-        try:
-            stat = path.stat()
-        except FileNotFoundError:
-            continue
-        backups.append(
-            BackupInfo(
-                name=path.name,
-                path=path,
-                size_bytes=stat.st_size,
-                created_at=datetime.fromtimestamp(stat.st_mtime),
+    # Una sola scansione della directory: prefisso/suffisso confrontati come
+    # stringhe (niente fnmatch) e stat letto dalla voce di scandir.
+    with os.scandir(backup_dir) as entries:
+        for entry in entries:
+            name = entry.name
+            if not (name.startswith("backup_") and name.endswith(".sqlite3")):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            backups.append(
+                BackupInfo(
+                    name=name,
+                    path=Path(entry.path),
+                    size_bytes=stat.st_size,
+                    created_at=datetime.fromtimestamp(stat.st_mtime),
+                )
             )
-        )
     backups.sort(key=lambda item: item.created_at, reverse=True)
     return backups
 
 
 def get_backup_path(filename: str) -> Path:
-    backup_dir = _resolve_backup_dir().resolve()
-    safe_name = Path(filename).name
-    candidate = (backup_dir / safe_name).resolve()
-    if backup_dir not in candidate.parents and candidate != backup_dir:
+    # Controllo solo sul nome, senza resolve() (un lstat per componente del
+    # percorso): un nome di backup valido non contiene separatori, quindi
+    # resta per forza dentro la directory dei backup. I symlink vengono
+    # rifiutati dal chiamante con lstat.
+    if (
+        "/" in filename
+        or "\\" in filename
+        or not filename.startswith("backup_")
+        or not filename.endswith(".sqlite3")
+    ):
         raise ValueError("Percorso backup non valido.")
-    return candidate
+    return _resolve_backup_dir() / filename
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class TTLCache:
+    """Cache in memoria, per processo, con scadenza per singola chiave.
+
+    Con max_entries, a cache piena si scarta la voce usata meno di recente.
+    """
+
+    def __init__(self, max_entries: int | None = None) -> None:
+        self._data: OrderedDict[str, tuple[object, float]] = OrderedDict()
+        self._lock = Lock()
+        self._max_entries = max_entries
+        self._sets_since_sweep = 0
+
+    def get(self, key: str) -> object | None:
+        now = time.monotonic()
+        with self._lock:
+            value = self._data.get(key)
+            if not value:
+                return None
+            cached_value, expires_at = value
+            if expires_at < now:
+                self._data.pop(key, None)
+                return None
+            if self._max_entries is not None:
+                self._data.move_to_end(key)
+            return cached_value
+
+    def set(self, key: str, value: object, ttl_seconds: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._data[key] = (value, now + ttl_seconds)
+            if self._max_entries is None:
+                return
+            self._data.move_to_end(key)
+            # Le voci scadute mai piu' lette si eliminano con una scansione
+            # ogni max_entries inserimenti: costo ammortizzato O(1) per set.
+            self._sets_since_sweep += 1
+            if self._sets_since_sweep >= self._max_entries:
+                self._sets_since_sweep = 0
+                for expired_key in [
+                    k for k, (_, expires_at) in self._data.items() if expires_at < now
+                ]:
+                    del self._data[expired_key]
+            while len(self._data) > self._max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
@@ -1,13 +1,80 @@
+import logging
+import os
+import time
+
 from sqlmodel import SQLModel, Session, create_engine
+from sqlalchemy import event
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 DATABASE_URL = "sqlite:///./lenta_france.db"
 
+# PRAGMA applicati a ogni nuova connessione SQLite: WAL consente letture
+# concorrenti con un writer, synchronous=NORMAL evita un fsync per commit.
+SQLITE_PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("temp_store", "MEMORY"),
+    ("mmap_size", "268435456"),
+    ("cache_size", "-64000"),
+    ("busy_timeout", "5000"),
+)
+
+# SQLite ammette un solo writer alla volta: il pool di scrittura ha una sola
+# connessione, cosi' le richieste in scrittura si accodano nel pool invece di
+# contendersi il lock del file. Le letture usano un pool separato.
 engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    pool_size=1,
+    max_overflow=0,
+)
+read_engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    pool_size=8,
+    max_overflow=4,
 )
 
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS:
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+# Query piu' lente di SLOW_QUERY_MS (0 = disattivato) finiscono nel log
+# delle prestazioni, senza parametri per non scrivere dati utente nei log.
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+
+perf_logger = logging.getLogger("lenta_france_gestionale.performance")
+
+
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_started"] = time.perf_counter()
+
+
+def _log_slow_query(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("query_started", None)
+    if started is None:
+        return
+    duration_ms = (time.perf_counter() - started) * 1000
+    if duration_ms >= SLOW_QUERY_MS:
+        perf_logger.warning(
+            "slow_query duration_ms=%.2f statement=%s", duration_ms, statement
+        )
+
+
+for _engine in (engine, read_engine):
+    event.listen(_engine, "connect", _set_sqlite_pragmas)
+    if SLOW_QUERY_MS > 0:
+        event.listen(_engine, "before_cursor_execute", _start_query_timer)
+        event.listen(_engine, "after_cursor_execute", _log_slow_query)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 Base = declarative_base()
 
@@ -20,6 +87,19 @@ def get_db():
         db.close()
 
 
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
 def get_session():
     with Session(engine) as session:
         yield session
+
+
+def get_read_session():
+    with Session(read_engine) as session:
+        yield session
@@ -1,19 +1,19 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import jwt, JWTError
-from sqlalchemy.orm import Session
+from sqlalchemy import bindparam, select
+from sqlalchemy.orm import Session, joinedload, with_loader_criteria
 
-from database import get_db
+from database import get_read_db
 from models import Site, User, RoleEnum
-from permissions import has_perm
-from auth import SECRET_KEY, ALGORITHM
+from permissions import CAPOSQUADRA_OR_ABOVE_ROLES, has_perm
+from auth import decode_access_token, get_user_by_email
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 
 def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
 ) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -21,15 +21,12 @@ def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
+    payload = decode_access_token(token)
+    if payload is None:
         raise credentials_exception
+    email: str = payload["sub"]
 
-    user = db.query(User).filter(User.email == email).first()
+    user = get_user_by_email(db, email)
     if user is None:
         raise credentials_exception
 
@@ -49,33 +46,58 @@ def require_manager_or_admin(current_user: User = Depends(get_current_user)) ->
 
 
 def require_caposquadra_or_above(current_user: User = Depends(get_current_user)) -> User:
-    if current_user.role not in (RoleEnum.admin, RoleEnum.manager, RoleEnum.caposquadra):
+    if current_user.role not in CAPOSQUADRA_OR_ABOVE_ROLES:
         raise HTTPException(status_code=403, detail="Ruolo non autorizzato")
     return current_user
 
 
-def scope_sites_query(query, current_user: User):
+def site_scope_options(current_user: User) -> tuple:
+    """
+    Opzioni di query che limitano ogni Site caricato (anche via JOIN o
+    relazione) ai cantieri assegnati al caposquadra corrente.
+    """
     if current_user.role == RoleEnum.caposquadra:
-        return query.filter(Site.caposquadra_id == current_user.id)
-    return query
+        return (
+            with_loader_criteria(
+                Site,
+                Site.caposquadra_id == current_user.id,
+                include_aliases=True,
+            ),
+        )
+    return ()
 
 
-def get_site_for_user(db: Session, site_id: int, current_user: User) -> Site:
-    query = db.query(Site).filter(Site.id == site_id)
-    query = scope_sites_query(query, current_user)
-    site = query.first()
-    if site:
-        return site
-    if current_user.role == RoleEnum.caposquadra:
-        exists = db.query(Site.id).filter(Site.id == site_id).first()
-        if exists:
-            raise HTTPException(status_code=403, detail="Cantiere non assegnato")
-    raise HTTPException(status_code=404, detail="Cantiere non trovato")
+def scope_sites_query(query, current_user: User):
+    return query.options(*site_scope_options(current_user))
+
+
+# Statement costruiti una volta all'import: a ogni richiesta si aggiungono
+# solo le opzioni e si passa il parametro, con chiave di cache SQL stabile.
+_SITE_BY_ID_STMT = select(Site).where(Site.id == bindparam("site_id"))
+
+
+def get_site_for_user(
+    db: Session, site_id: int, current_user: User, *loader_options
+) -> Site:
+    # Una sola query senza filtro di scope: l'assegnazione si verifica sulla
+    # riga caricata, distinguendo 403 da 404 senza una seconda SELECT.
+    stmt = _SITE_BY_ID_STMT.options(*loader_options)
+    site = db.scalars(stmt, {"site_id": site_id}).unique().first()
+    if site is None:
+        raise HTTPException(status_code=404, detail="Cantiere non trovato")
+    if (
+        current_user.role == RoleEnum.caposquadra
+        and site.caposquadra_id != current_user.id
+    ):
+        raise HTTPException(status_code=403, detail="Cantiere non assegnato")
+    return site
 
 
 def get_authorized_site(
     site_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(require_caposquadra_or_above),
 ) -> Site:
-    return get_site_for_user(db, site_id, current_user)
+    return get_site_for_user(
+        db, site_id, current_user, joinedload(Site.caposquadra)
+    )
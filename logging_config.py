@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+import atexit
 import logging
 import os
+import queue
 import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
 from typing import Optional
 
 
@@ -13,6 +17,26 @@ def _parse_level(value: Optional[str], default: int) -> int:
     return level if isinstance(level, int) else default
 
 
+class _CachedTimeFormatter(logging.Formatter):
+    """Formatter che riusa data e ora finche' non cambia il secondo."""
+
+    _cached_time: tuple[int, str] = (-1, "")
+
+    def formatTime(
+        self, record: logging.LogRecord, datefmt: Optional[str] = None
+    ) -> str:
+        if datefmt:
+            return super().formatTime(record, datefmt)
+        second = int(record.created)
+        cached_second, text = self._cached_time
+        if second != cached_second:
+            text = time.strftime(
+                self.default_time_format, self.converter(record.created)
+            )
+            self._cached_time = (second, text)
+        return self.default_msec_format % (text, record.msecs)
+
+
 def configure_logging() -> None:
     root_logger = logging.getLogger()
     if root_logger.handlers:
@@ -22,19 +46,27 @@ def configure_logging() -> None:
     file_level = _parse_level(os.getenv("LOG_FILE_LEVEL"), logging.WARNING)
     log_file = os.getenv("LOG_FILE")
 
-    formatter = logging.Formatter(
+    formatter = _CachedTimeFormatter(
         "%(asctime)s %(levelname)s %(name)s %(message)s"
     )
 
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(console_level)
     console_handler.setFormatter(formatter)
-    root_logger.addHandler(console_handler)
+    handlers: list[logging.Handler] = [console_handler]
 
     if log_file:
         file_handler = logging.FileHandler(log_file)
         file_handler.setLevel(file_level)
         file_handler.setFormatter(formatter)
-        root_logger.addHandler(file_handler)
+        handlers.append(file_handler)
+
+    # Le richieste accodano solo il record: scrittura su stdout e su file
+    # avvengono nel thread del listener, fuori dall'event loop.
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    root_logger.addHandler(QueueHandler(log_queue))
+    listener.start()
+    atexit.register(listener.stop)
 
     root_logger.setLevel(min(console_level, file_level))
@@ -1,37 +1,41 @@
+import hashlib
 import logging
 import os
 import time
 import uuid
+from contextlib import asynccontextmanager
 from datetime import date, datetime, timedelta
 from math import ceil
 from typing import List
 
 from fastapi import FastAPI, Request, Depends, Form, HTTPException, status
-from fastapi.encoders import jsonable_encoder
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.templating import Jinja2Templates
+from jinja2 import Template
 from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import QueryParams
 from starlette.exceptions import HTTPException as StarletteHTTPException
-from jose import JWTError, jwt
 
-from sqlalchemy import case, func
-from sqlalchemy.orm import joinedload, load_only, Session
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import contains_eager, joinedload, load_only, selectinload, Session
 from sqlmodel import SQLModel
 
-from database import Base, engine, SessionLocal, get_db
+from database import Base, engine, ReadSessionLocal, SessionLocal, get_read_db
 from auth import (
+    ACCESS_TOKEN_EXPIRE_MINUTES,
     router as auth_router,
     hash_password,
     authenticate_user,
     create_access_token,
     get_current_active_user,
     get_current_active_user_html,
-    get_user_by_email,
-    SECRET_KEY,
-    ALGORITHM,
+    get_user_from_cookie,
+    invalidate_current_user_cache,
+    verify_password,
 )
-from deps import get_site_for_user, scope_sites_query
+from deps import get_site_for_user, scope_sites_query, site_scope_options
 from models import (
     User,
     RoleEnum,
@@ -52,7 +56,11 @@ from routers import users, sites, machines, reports, fiches, notifications
 from routes import manager_personale, manager_veicoli, magazzino, audit, reportistica, backup
 
 from template_context import (
+    DEFAULT_LANGUAGE,
+    SUPPORTED_LANGUAGES,
+    TEMPLATE_ENV,
     build_template_context,
+    get_cached_manager_dashboard_charts,
     get_cached_role_choices,
     get_cached_site_status_values,
     get_lang_from_request,
@@ -60,10 +68,12 @@ from template_context import (
     register_permission_helpers,
     register_static_helpers,
     render_template,
+    warm_template_cache,
 )
 from permissions import has_perm
 from notifications import notify_site_status_change
 from audit_utils import log_audit_event
+from cache_utils import TTLCache
 from logging_config import configure_logging
 
 
@@ -71,10 +81,15 @@ configure_logging()
 
 logger = logging.getLogger("lenta_france_gestionale.errors")
 perf_logger = logging.getLogger("lenta_france_gestionale.performance")
+startup_logger = logging.getLogger("lenta_france_gestionale.startup")
 
 DEFAULT_PER_PAGE = 50
 MAX_PER_PAGE = 100
 
+LANG_COOKIE_MAX_AGE = 60 * 60 * 24 * 365  # 1 anno
+# Il cookie di sessione non deve sopravvivere al JWT che contiene.
+ACCESS_TOKEN_COOKIE_MAX_AGE = ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
 
 def _normalize_pagination(page: int, per_page: int) -> tuple[int, int]:
     page = max(1, page)
@@ -86,9 +101,10 @@ def _normalize_pagination(page: int, per_page: int) -> tuple[int, int]:
 # CREAZIONE TABELLE + ADMIN INIZIALE
 # -------------------------------------------------
 
-# Crea tutte le tabelle definite in models.py
-Base.metadata.create_all(bind=engine)
-SQLModel.metadata.create_all(bind=engine)
+def create_tables():
+    """Crea tutte le tabelle definite in models.py."""
+    Base.metadata.create_all(bind=engine)
+    SQLModel.metadata.create_all(bind=engine)
 
 
 ADMIN_EMAIL = os.getenv("ADMIN_EMAIL")
@@ -96,6 +112,18 @@ ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
 ADMIN_LANGUAGE = os.getenv("ADMIN_LANGUAGE", "it")
 
 
+def _initial_admin_is_current(
+    admin: User, admin_password: str, admin_language: str
+) -> bool:
+    return bool(
+        admin.full_name
+        and admin.role == RoleEnum.admin
+        and admin.language == admin_language
+        and admin.is_active
+        and verify_password(admin_password, admin.hashed_password)
+    )
+
+
 def create_initial_admin():
     """
     Crea o aggiorna l'utente admin iniziale usando credenziali
@@ -110,15 +138,19 @@ def create_initial_admin():
     admin_language = ADMIN_LANGUAGE or "it"
 
     db = SessionLocal()
-    hashed_password = hash_password(admin_password)
     try:
         admin = db.query(User).filter(User.email == admin_email).first()
+        if admin and _initial_admin_is_current(
+            admin, admin_password, admin_language
+        ):
+            # Riavvio a caldo: l'admin e' gia' allineato, nessuna scrittura.
+            return
         if admin:
             admin.full_name = admin.full_name or admin_email
             admin.role = RoleEnum.admin
             admin.language = admin_language
             admin.is_active = True
-            admin.hashed_password = hashed_password
+            admin.hashed_password = hash_password(admin_password)
             message = "Admin iniziale aggiornato."
         else:
             admin = User(
@@ -126,22 +158,44 @@ def create_initial_admin():
                 full_name=admin_email,
                 role=RoleEnum.admin,
                 language=admin_language,
-                hashed_password=hashed_password,
+                hashed_password=hash_password(admin_password),
                 is_active=True,
             )
             db.add(admin)
             message = "Admin iniziale creato."
 
         db.commit()
-        print(message)
-    except Exception as exc:
+        startup_logger.info("%s email=%s", message, admin_email)
+    except Exception:
         db.rollback()
-        print(f"Errore nella creazione/aggiornamento dell'admin iniziale: {exc}")
+        logger.exception("Errore nella creazione/aggiornamento dell'admin iniziale")
     finally:
         db.close()
 
 
-create_initial_admin()
+# Pagine d'ingresso (pubbliche e dashboard) con i loro layout: compilate
+# all'avvio, cosi' la prima richiesta non paga la compilazione Jinja.
+STARTUP_TEMPLATES = (
+    "base.html",
+    "shared/base.html",
+    "home.html",
+    "login.html",
+    "offline.html",
+    "manager/home_manager.html",
+    "capo/home_capo.html",
+    "capo_nuovo_rapportino.html",
+    "manager/rapportini_list.html",
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # DDL e admin iniziale all'avvio del server, non all'import del modulo:
+    # script e test che importano main non toccano il database.
+    create_tables()
+    create_initial_admin()
+    warm_template_cache(STARTUP_TEMPLATES)
+    yield
 
 
 # -------------------------------------------------
@@ -152,36 +206,52 @@ app = FastAPI(
     title="Lenta France Gestionale",
     description="Gestionale cantieri, macchinari, fiches e rapportini.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],        # se vuoi, in futuro, restringi ai tuoi domini
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Interfaccia e API sono servite dalla stessa origine: il CORS serve solo per
+# eventuali client esterni, elencati in CORS_ALLOW_ORIGINS (separati da
+# virgola). Senza origini configurate il middleware non viene installato.
+CORS_ALLOW_ORIGINS = [
+    origin.strip()
+    for origin in os.getenv("CORS_ALLOW_ORIGINS", "").split(",")
+    if origin.strip()
+]
+if CORS_ALLOW_ORIGINS:
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=CORS_ALLOW_ORIGINS,
+        allow_credentials=True,
+        allow_methods=["GET", "POST"],
+        allow_headers=["Authorization", "Content-Type"],
+    )
 
 
-@app.middleware("http")
-async def add_static_cache_headers(request: Request, call_next):
-    response = await call_next(request)
-    if request.url.path.startswith("/static/"):
-        if "v" in request.query_params:
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles con Cache-Control: immutabile per gli URL versionati (?v=),
+    un giorno per gli altri. Impostato qui invece che in un middleware HTTP,
+    che avvolgeva ogni richiesta dell'app e non solo quelle agli asset.
+    """
+
+    async def get_response(self, path: str, scope) -> Response:
+        response = await super().get_response(path, scope)
+        if "v" in QueryParams(scope["query_string"]):
             response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
         else:
             response.headers["Cache-Control"] = "public, max-age=86400"
-    return response
+        return response
+
 
 # Static (CSS, immagini, JS)
 app.mount(
     "/static",
-    StaticFiles(directory="static"),
+    CachedStaticFiles(directory="static"),
     name="static",
 )
 
 # Templates HTML (Jinja2)
-templates = Jinja2Templates(directory="templates")
+templates = Jinja2Templates(env=TEMPLATE_ENV)
 register_manager_badges(templates)
 register_static_helpers(templates)
 register_permission_helpers(templates)
@@ -205,6 +275,27 @@ def _build_error_context(request: Request, status_code: int) -> dict:
     )
 
 
+# Template delle pagine d'errore risolti una volta: ogni risposta contiene il
+# request id, quindi si rende il Template direttamente senza cachare l'output.
+_ERROR_TEMPLATE_NAMES = {
+    status.HTTP_403_FORBIDDEN: "errors/403.html",
+    status.HTTP_404_NOT_FOUND: "errors/404.html",
+    status.HTTP_500_INTERNAL_SERVER_ERROR: "errors/500.html",
+}
+_ERROR_TEMPLATES: dict[int, Template] = {}
+
+
+def _render_error_page(request: Request, status_code: int) -> HTMLResponse:
+    template = _ERROR_TEMPLATES.get(status_code)
+    if template is None:
+        template = TEMPLATE_ENV.get_template(_ERROR_TEMPLATE_NAMES[status_code])
+        _ERROR_TEMPLATES[status_code] = template
+    return HTMLResponse(
+        template.render(_build_error_context(request, status_code)),
+        status_code=status_code,
+    )
+
+
 @app.middleware("http")
 async def request_id_middleware(request: Request, call_next):
     request_id = request.headers.get("X-Request-ID") or str(uuid.uuid4())
@@ -226,21 +317,14 @@ async def http_exception_handler(request: Request, exc: StarletteHTTPException):
         request_id,
     )
 
-    if status_code == status.HTTP_403_FORBIDDEN:
-        response = templates.TemplateResponse(
-            "errors/403.html",
-            _build_error_context(request, status_code),
-            status_code=status_code,
-        )
-    elif status_code == status.HTTP_404_NOT_FOUND:
-        response = templates.TemplateResponse(
-            "errors/404.html",
-            _build_error_context(request, status_code),
-            status_code=status_code,
-        )
+    if status_code in (status.HTTP_403_FORBIDDEN, status.HTTP_404_NOT_FOUND):
+        response = _render_error_page(request, status_code)
     else:
         response = JSONResponse(status_code=status_code, content={"detail": exc.detail})
 
+    # Es. Location del redirect al login sollevato da get_current_user_html.
+    if exc.headers:
+        response.headers.update(exc.headers)
     response.headers["X-Request-ID"] = request_id
     return response
 
@@ -254,11 +338,7 @@ async def unhandled_exception_handler(request: Request, exc: Exception):
         request.url.path,
         request_id,
     )
-    response = templates.TemplateResponse(
-        "errors/500.html",
-        _build_error_context(request, status.HTTP_500_INTERNAL_SERVER_ERROR),
-        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-    )
+    response = _render_error_page(request, status.HTTP_500_INTERNAL_SERVER_ERROR)
     response.headers["X-Request-ID"] = request_id
     return response
 
@@ -266,41 +346,91 @@ async def unhandled_exception_handler(request: Request, exc: Exception):
 # -------------------------------------------------
 # MULTILINGUA (COOKIE) + HOMEPAGE TEMPLATE
 # -------------------------------------------------
-def _get_user_from_cookie(request: Request) -> User | None:
-    cookie_token = request.cookies.get("access_token")
-    if not cookie_token:
-        return None
-
-    token = cookie_token
-    if token.startswith("Bearer "):
-        token = token[len("Bearer ") :]
-
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-    except JWTError:
-        return None
-
-    email = payload.get("sub")
-    if not email:
+async def _get_user_from_cookie(request: Request) -> User | None:
+    if "access_token" not in request.cookies:
         return None
-
-    db = SessionLocal()
+    # Stesse cache token -> utente delle pagine protette: la sessione tocca
+    # il database (nel threadpool) solo se l'utente non e' gia' in cache.
+    db = ReadSessionLocal()
     try:
-        user = get_user_by_email(db, email=email)
-        if user and getattr(user, "is_active", True):
-            return user
+        user = await get_user_from_cookie(request, db)
     finally:
         db.close()
+    if user and getattr(user, "is_active", True):
+        return user
     return None
 
 
+# Le pagine pubbliche (homepage, login, offline) per utenti anonimi dipendono
+# solo dalla lingua, dall'host usato negli url_for e dal contesto passato
+# dall'handler: vengono renderizzate una volta per combinazione e riusate,
+# gia' codificate e con il relativo ETag. L'host arriva dal client, quindi si
+# cacha solo per gli host elencati in PUBLIC_PAGE_CACHE_HOSTS (host[:porta],
+# separati da virgola): senza elenco le pagine vengono sempre renderizzate.
+PUBLIC_PAGE_CACHE_HOSTS = frozenset(
+    host.strip().lower()
+    for host in os.getenv("PUBLIC_PAGE_CACHE_HOSTS", "").split(",")
+    if host.strip()
+)
+_PUBLIC_PAGE_CACHE = TTLCache(max_entries=64)
+PUBLIC_PAGE_CACHE_TTL_SECONDS = 600
+
+
+def _render_public_page(request: Request, template_name: str, **context):
+    return templates.TemplateResponse(
+        template_name,
+        build_template_context(request, None, **context),
+    )
+
+
+def _public_page_body(
+    request: Request, template_name: str, **context
+) -> tuple[bytes, str | None]:
+    # Il template legge il cookie grezzo: i valori non supportati non si cachano.
+    lang_cookie = request.cookies.get("lang")
+    if (
+        request.url.netloc.lower() not in PUBLIC_PAGE_CACHE_HOSTS
+        or (lang_cookie is not None and lang_cookie not in SUPPORTED_LANGUAGES)
+    ):
+        return bytes(_render_public_page(request, template_name, **context).body), None
+
+    cache_key = repr(
+        (
+            template_name,
+            lang_cookie or DEFAULT_LANGUAGE,
+            str(request.base_url),
+            request.query_params.get("section") or "",
+            tuple(sorted(context.items())),
+        )
+    )
+    cached = _PUBLIC_PAGE_CACHE.get(cache_key)
+    if cached is None:
+        body = bytes(_render_public_page(request, template_name, **context).body)
+        cached = (body, f'"{hashlib.sha1(body).hexdigest()}"')
+        _PUBLIC_PAGE_CACHE.set(cache_key, cached, PUBLIC_PAGE_CACHE_TTL_SECONDS)
+    return cached
+
+
+def _cached_public_page(request: Request, template_name: str, **context):
+    body, etag = _public_page_body(request, template_name, **context)
+    if etag is None:
+        return HTMLResponse(body)
+
+    # no-cache: il browser rivalida sempre, perche' un cookie di login
+    # deve comunque produrre il redirect alla dashboard.
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Cookie"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return HTMLResponse(body, headers=headers)
+
+
 @app.get("/", response_class=HTMLResponse)
-def homepage(request: Request):
+async def homepage(request: Request):
     """
     Homepage con selezione lingua, login e accesso dashboard.
     Usa il template 'home.html'.
     """
-    current_user = _get_user_from_cookie(request)
+    current_user = await _get_user_from_cookie(request)
     if current_user:
         destination = (
             "/manager/dashboard"
@@ -309,14 +439,8 @@ def homepage(request: Request):
         )
         return RedirectResponse(url=destination, status_code=303)
 
-    lang = get_lang_from_request(request)
-    return templates.TemplateResponse(
-        "home.html",
-        build_template_context(
-            request,
-            None,
-            lang=lang,
-        ),
+    return _cached_public_page(
+        request, "home.html", lang=get_lang_from_request(request)
     )
 
 @app.get("/offline", response_class=HTMLResponse)
@@ -324,28 +448,24 @@ def offline(request: Request):
     """
     Pagina di fallback per modalità offline (PWA).
     """
-    lang = get_lang_from_request(request)
-    return templates.TemplateResponse(
+    return _cached_public_page(
+        request,
         "offline.html",
-        build_template_context(
-            request,
-            None,
-            lang=lang,
-            title="Sei offline",
-            nuove_richieste_count=0,
-        ),
+        lang=get_lang_from_request(request),
+        title="Sei offline",
+        nuove_richieste_count=0,
     )
 
 
 @app.get("/set-lang")
-def set_lang(lang: str = "it"):
+async def set_lang(lang: str = "it"):
     """
     Imposta la lingua (it / fr) nel cookie e torna alla homepage.
     """
-    if lang not in ("it", "fr"):
-        lang = "it"
+    if lang not in SUPPORTED_LANGUAGES:
+        lang = DEFAULT_LANGUAGE
     response = RedirectResponse(url="/")
-    response.set_cookie(key="lang", value=lang, max_age=60 * 60 * 24 * 365)
+    response.set_cookie(key="lang", value=lang, max_age=LANG_COOKIE_MAX_AGE)
     return response
 
 
@@ -355,8 +475,8 @@ async def set_language(lang_code: str, request: Request):
     Set UI language via cookie and redirect back to the previous page.
     """
     lang = lang_code.lower()
-    if lang not in ("it", "fr"):
-        lang = "it"
+    if lang not in SUPPORTED_LANGUAGES:
+        lang = DEFAULT_LANGUAGE
 
     referer = request.headers.get("referer") or "/"
     response = RedirectResponse(url=referer, status_code=303)
@@ -364,7 +484,7 @@ async def set_language(lang_code: str, request: Request):
     response.set_cookie(
         key="lang",
         value=lang,
-        max_age=60 * 60 * 24 * 365,  # 1 year
+        max_age=LANG_COOKIE_MAX_AGE,
         secure=False,
         httponly=False,
         samesite="lax",
@@ -439,6 +559,28 @@ def _validate_fiche_geometria(
         )
 
 
+def _insert_fiche_strati(
+    db: Session,
+    fiche_id: int,
+    strato_da: list[float | None],
+    strato_a: list[float | None],
+    strato_materiale: list[str],
+) -> None:
+    """Salva gli strati validi della fiche con un unico INSERT multi-riga."""
+    rows = [
+        {
+            "fiche_id": fiche_id,
+            "da_profondita": da_val,
+            "a_profondita": a_val,
+            "materiale": mat,
+        }
+        for da_val, a_val, mat in zip(strato_da, strato_a, strato_materiale)
+        if mat and da_val is not None and a_val is not None and a_val > da_val
+    ]
+    if rows:
+        db.execute(insert(FicheStratigrafia), rows)
+
+
 def _build_fiche_form_data(
     cantiere_id: int | str | None = None,
     macchinario_id: int | str | None = None,
@@ -508,7 +650,7 @@ def _build_fiche_form_data(
 
 
 def _load_capo_form_collections(current_user: User) -> tuple[list[Site], list[Machine]]:
-    db = SessionLocal()
+    db = ReadSessionLocal()
     try:
         sites = _get_capo_assigned_sites(db, current_user)
         allowed_site_ids = [s.id for s in sites]
@@ -523,7 +665,7 @@ def _load_capo_form_collections(current_user: User) -> tuple[list[Site], list[Ma
 
 
 def _load_manager_form_collections() -> tuple[list[Site], list[Machine]]:
-    db = SessionLocal()
+    db = ReadSessionLocal()
     try:
         sites = (
             db.query(Site)
@@ -547,23 +689,20 @@ def _load_manager_form_collections() -> tuple[list[Site], list[Machine]]:
 # -------------------------------------------------
 
 @app.get("/login", response_class=HTMLResponse)
-def login_page(request: Request):
+async def login_page(request: Request):
     """
     Pagina di login HTML (form).
     Il JS dentro login.html può usare /auth/login o /auth/token per ottenere il JWT.
     """
-    return templates.TemplateResponse(
-        "login.html",
-        build_template_context(request, None),
-    )
+    return _cached_public_page(request, "login.html")
 
 
 @app.post("/auth/login")
-def login_api(
+async def login_api(
     request: Request,
     email: str = Form(...),
     password: str = Form(...),
-    db=Depends(get_db),
+    db=Depends(get_read_db, scope="function"),
 ):
     """
     Endpoint usato dal form di login.
@@ -571,18 +710,16 @@ def login_api(
     - Se ok, crea un JWT
     - Decide dove mandare l'utente (manager vs caposquadra)
     """
-    user = authenticate_user(db, email=email, password=password)
+    # pbkdf2 blocca per decine di ms: la verifica gira nel threadpool, come
+    # in /auth/token.
+    user = await run_in_threadpool(authenticate_user, db, email, password)
     if not user:
-        # Torniamo la pagina di login con errore
-        return templates.TemplateResponse(
-            "login.html",
-            build_template_context(
-                request,
-                None,
-                login_error="Email o password non corretti",
-            ),
-            status_code=400,
+        # Torniamo la pagina di login con errore: il messaggio e' fisso, quindi
+        # la pagina renderizzata si riusa dalla cache delle pagine pubbliche.
+        body, _ = _public_page_body(
+            request, "login.html", login_error="Email o password non corretti"
         )
+        return HTMLResponse(body, status_code=400)
     if hasattr(user, "is_active") and not user.is_active:
         raise HTTPException(status_code=400, detail="Utente disattivato")
 
@@ -611,7 +748,7 @@ def login_api(
         key="access_token",
         value=f"Bearer {access_token}",
         httponly=True,
-        max_age=60 * 60,  # 1 ora
+        max_age=ACCESS_TOKEN_COOKIE_MAX_AGE,
         path="/",
     )
     return response
@@ -635,41 +772,14 @@ def manager_dashboard(
     """
     Dashboard manager con accesso a cantieri, fiches, rapportini e macchinari.
     """
-    db = SessionLocal()
+    db = ReadSessionLocal()
     sites_map_data: list[dict[str, object]] = []
     try:
         detail_url_template = str(
             request.url_for("manager_site_detail", site_id="__SITE_ID__")
         )
         query_started = time.monotonic()
-        sites_with_coords = (
-            db.query(Site)
-            .options(
-                load_only(
-                    Site.id,
-                    Site.name,
-                    Site.address,
-                    Site.city,
-                    Site.country,
-                    Site.lat,
-                    Site.lng,
-                    Site.status,
-                    Site.is_active,
-                    Site.caposquadra_id,
-                ),
-                joinedload(Site.caposquadra).load_only(
-                    User.id,
-                    User.full_name,
-                    User.email,
-                ),
-            )
-            .filter(
-                Site.lat.isnot(None),
-                Site.lng.isnot(None),
-            )
-            .order_by(Site.name)
-            .all()
-        )
+        sites_with_coords = db.execute(_MANAGER_SITES_MAP_STMT).mappings().all()
         perf_logger.debug(
             "manager_dashboard sites_map query rows=%s duration_ms=%.2f",
             len(sites_with_coords),
@@ -679,6 +789,7 @@ def manager_dashboard(
         query_started = time.monotonic()
         reports_list = (
             db.query(Report)
+            .outerjoin(Site, Site.id == Report.site_id)
             .options(
                 load_only(
                     Report.id,
@@ -687,7 +798,9 @@ def manager_dashboard(
                     Report.site_id,
                     Report.site_name_or_code,
                 ),
-                joinedload(Report.site).load_only(Site.id, Site.name),
+                # Join esplicito ed eager dalla stessa JOIN: nessun alias
+                # anonimo e nessuna subquery attorno al LIMIT.
+                contains_eager(Report.site).load_only(Site.id, Site.name),
             )
             .order_by(Report.date.desc(), Report.id.desc())
             .limit(50)
@@ -699,92 +812,49 @@ def manager_dashboard(
             (time.monotonic() - query_started) * 1000,
         )
 
-        start_date = date.today() - timedelta(days=30)
-
-        query_started = time.monotonic()
-        reports_last_30_days_rows = (
-            db.query(Report.date.label("report_date"), func.count(Report.id).label("count"))
-            .filter(Report.date >= start_date)
-            .group_by(Report.date)
-            .order_by(Report.date)
-            .all()
-        )
-        perf_logger.debug(
-            "manager_dashboard reports_last_30_days rows=%s duration_ms=%.2f",
-            len(reports_last_30_days_rows),
-            (time.monotonic() - query_started) * 1000,
-        )
-        reports_last_30_days = [
-            {"date": row.report_date.isoformat(), "count": row.count}
-            for row in reports_last_30_days_rows
-        ]
-
         query_started = time.monotonic()
-        hours_per_site_rows = (
-            db.query(
-                func.coalesce(Site.name, Report.site_name_or_code).label("site_name"),
-                func.sum(Report.total_hours).label("hours"),
-            )
-            .outerjoin(Site, Site.id == Report.site_id)
-            .filter(Report.date >= start_date)
-            .group_by("site_name")
-            .order_by(func.sum(Report.total_hours).desc())
-            .all()
+        reports_last_30_days, hours_per_site_30_days = (
+            get_cached_manager_dashboard_charts(db)
         )
         perf_logger.debug(
-            "manager_dashboard hours_per_site rows=%s duration_ms=%.2f",
-            len(hours_per_site_rows),
+            "manager_dashboard charts duration_ms=%.2f",
             (time.monotonic() - query_started) * 1000,
         )
-        hours_per_site_30_days = [
-            {"site_name": row.site_name or "Senza nome", "hours": float(row.hours or 0)}
-            for row in hours_per_site_rows
-        ]
 
+        # KPI e ripartizione aperti/chiusi in una sola SELECT di subquery
+        # scalari invece di cinque query separate.
         query_started = time.monotonic()
-        reports_by_status_rows = (
-            db.query(
-                case(
-                    (func.coalesce(Report.total_hours, 0) > 0, "Chiusi"),
-                    else_="Aperti",
-                ).label("status"),
-                func.count(Report.id).label("count"),
+        kpi = db.execute(
+            select(
+                select(func.count(Report.id)).scalar_subquery().label("reports"),
+                select(func.count(Report.id))
+                .where(func.coalesce(Report.total_hours, 0) > 0)
+                .scalar_subquery()
+                .label("reports_closed"),
+                select(func.count(Site.id))
+                .where(Site.is_active.is_(True))
+                .scalar_subquery()
+                .label("sites"),
+                select(func.count(Machine.id)).scalar_subquery().label("machines"),
+                select(func.count(User.id))
+                .where(User.role.in_([RoleEnum.manager, RoleEnum.caposquadra]))
+                .scalar_subquery()
+                .label("users"),
             )
-            .group_by("status")
-            .all()
-        )
+        ).one()
         perf_logger.debug(
-            "manager_dashboard reports_by_status rows=%s duration_ms=%.2f",
-            len(reports_by_status_rows),
+            "manager_dashboard kpi_counts duration_ms=%.2f",
             (time.monotonic() - query_started) * 1000,
         )
-        reports_by_status_counts = {"Aperti": 0, "Chiusi": 0}
-        for row in reports_by_status_rows:
-            reports_by_status_counts[row.status] = int(row.count or 0)
+        reports_count = int(kpi.reports or 0)
+        reports_closed = int(kpi.reports_closed or 0)
+        sites_count = int(kpi.sites or 0)
+        machines_count = int(kpi.machines or 0)
+        users_count = int(kpi.users or 0)
         reports_by_status = [
-            {"status": key, "count": value}
-            for key, value in reports_by_status_counts.items()
+            {"status": "Aperti", "count": reports_count - reports_closed},
+            {"status": "Chiusi", "count": reports_closed},
         ]
-
-        query_started = time.monotonic()
-        reports_count = db.query(func.count(Report.id)).scalar() or 0
-        sites_count = (
-            db.query(func.count(Site.id))
-            .filter(Site.is_active.is_(True))
-            .scalar()
-            or 0
-        )
-        machines_count = db.query(func.count(Machine.id)).scalar() or 0
-        users_count = (
-            db.query(func.count(User.id))
-            .filter(User.role.in_([RoleEnum.manager, RoleEnum.caposquadra]))
-            .scalar()
-            or 0
-        )
-        perf_logger.debug(
-            "manager_dashboard kpi_counts duration_ms=%.2f",
-            (time.monotonic() - query_started) * 1000,
-        )
         response = render_template(
             templates,
             request,
@@ -796,10 +866,10 @@ def manager_dashboard(
                 "sites_count": sites_count,
                 "machines_count": machines_count,
                 "users_count": users_count,
-                "chart_reports_last_30_days": jsonable_encoder(reports_last_30_days),
-                "chart_hours_per_site_30_days": jsonable_encoder(hours_per_site_30_days),
-                "chart_reports_by_status": jsonable_encoder(reports_by_status),
-                "cantieri_map_data": jsonable_encoder(sites_map_data),
+                "chart_reports_last_30_days": reports_last_30_days,
+                "chart_hours_per_site_30_days": hours_per_site_30_days,
+                "chart_reports_by_status": reports_by_status,
+                "cantieri_map_data": sites_map_data,
                 "detail_url_template": detail_url_template,
                 "google_maps_api_key": os.getenv("GOOGLE_MAPS_API_KEY"),
             },
@@ -811,29 +881,68 @@ def manager_dashboard(
     return response
 
 
-def _build_sites_map_data(sites: list[Site]) -> list[dict[str, object]]:
+# Colonne lette per la mappa dei cantieri: righe scalari, senza idratare
+# oggetti Site ne' passare dall'identity map.
+_SITES_MAP_COLUMNS = (
+    Site.id,
+    Site.name,
+    Site.address,
+    Site.city,
+    Site.country,
+    Site.lat,
+    Site.lng,
+    Site.status,
+    Site.is_active,
+    Site.caposquadra_id,
+)
+
+_MANAGER_SITES_MAP_STMT = (
+    select(
+        *_SITES_MAP_COLUMNS,
+        User.full_name.label("caposquadra_full_name"),
+        User.email.label("caposquadra_email"),
+    )
+    .select_from(Site)
+    .outerjoin(User, User.id == Site.caposquadra_id)
+    .where(Site.lat.isnot(None), Site.lng.isnot(None))
+    .order_by(Site.name)
+)
+
+# Il caposquadra e' l'utente corrente: niente JOIN su users.
+_CAPO_SITES_MAP_STMT = (
+    select(*_SITES_MAP_COLUMNS)
+    .where(
+        Site.is_active.is_(True),
+        Site.lat.isnot(None),
+        Site.lng.isnot(None),
+    )
+    .order_by(Site.name)
+)
+
+
+def _build_sites_map_data(rows) -> list[dict[str, object]]:
+    """Converte le righe di _SITES_MAP_COLUMNS (mappings) nel JSON della mappa."""
     sites_map_data = []
-    for site in sites:
-        address_parts = [part for part in [site.address, site.city, site.country] if part]
-        status_value = site.status.value if site.status else None
-        caposquadra_name = None
-        if "caposquadra" in site.__dict__ and site.caposquadra:
-            caposquadra_name = site.caposquadra.full_name or site.caposquadra.email
+    for row in rows:
+        caposquadra_name = row.get("caposquadra_full_name") or row.get(
+            "caposquadra_email"
+        )
+        status_value = row["status"]
         sites_map_data.append(
             {
-                "id": int(site.id) if site.id is not None else None,
-                "name": str(site.name) if site.name is not None else "",
-                "lat": float(site.lat) if site.lat is not None else None,
-                "lng": float(site.lng) if site.lng is not None else None,
-                "address": ", ".join(str(part) for part in address_parts),
-                "status": str(status_value) if status_value is not None else None,
-                "is_active": site.is_active if site.is_active is not None else None,
-                "caposquadra_id": (
-                    int(site.caposquadra_id) if site.caposquadra_id is not None else None
-                ),
-                "caposquadra_name": (
-                    str(caposquadra_name) if caposquadra_name is not None else None
+                "id": row["id"],
+                "name": row["name"] or "",
+                "lat": float(row["lat"]) if row["lat"] is not None else None,
+                "lng": float(row["lng"]) if row["lng"] is not None else None,
+                "address": ", ".join(
+                    str(part)
+                    for part in (row["address"], row["city"], row["country"])
+                    if part
                 ),
+                "status": status_value.value if status_value is not None else None,
+                "is_active": row["is_active"],
+                "caposquadra_id": row["caposquadra_id"],
+                "caposquadra_name": caposquadra_name,
             }
         )
     return sites_map_data
@@ -872,7 +981,7 @@ def manager_fiche_new_form(
     response_class=HTMLResponse,
     name="manager_fiche_create",
 )
-async def manager_fiche_create(
+def manager_fiche_create(
     request: Request,
     current_user: User = Depends(get_current_active_user_html),
     cantiere_id: int = Form(...),
@@ -917,14 +1026,12 @@ async def manager_fiche_create(
 
         db = SessionLocal()
         try:
-            site = db.query(Site).filter(Site.id == cantiere_id).first()
+            site = db.get(Site, cantiere_id)
             if not site:
                 raise HTTPException(status_code=400, detail="Cantiere non trovato")
 
             if parsed_machine_id is not None:
-                machine = (
-                    db.query(Machine).filter(Machine.id == parsed_machine_id).first()
-                )
+                machine = db.get(Machine, parsed_machine_id)
                 if not machine:
                     raise HTTPException(status_code=400, detail="Macchinario non trovato")
 
@@ -949,23 +1056,13 @@ async def manager_fiche_create(
                 created_by_id=current_user.id,
             )
             db.add(fiche)
-            db.commit()
-            db.refresh(fiche)
-
-            for da_val, a_val, mat in zip(strato_da, strato_a, strato_materiale):
-                if not mat:
-                    continue
-                if da_val is None or a_val is None:
-                    continue
-                if a_val <= da_val:
-                    continue
-                layer = FicheStratigrafia(
-                    fiche_id=fiche.id,
-                    da_profondita=da_val,
-                    a_profondita=a_val,
-                    materiale=mat,
-                )
-                db.add(layer)
+            # Il flush basta a ottenere l'id: fiche e strati vanno in un'unica
+            # transazione, senza il commit e la SELECT di refresh intermedi.
+            db.flush()
+
+            _insert_fiche_strati(
+                db, fiche.id, strato_da, strato_a, strato_materiale
+            )
             db.commit()
         finally:
             db.close()
@@ -1065,11 +1162,11 @@ def manager_users(
             detail="Permessi insufficienti",
         )
 
-    db = SessionLocal()
+    db = ReadSessionLocal()
     try:
         users_list = (
             db.query(User)
-            .options(joinedload(User.assigned_sites))
+            .options(selectinload(User.assigned_sites))
             .order_by(User.role, User.email)
             .all()
         )
@@ -1094,7 +1191,7 @@ def manager_users(
 @app.get("/admin/users", response_class=JSONResponse)
 def admin_users(
     current_user: User = Depends(get_current_active_user_html),
-):
+) -> dict[str, str]:
     if not has_perm(current_user, "users.manage"):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -1114,7 +1211,7 @@ def admin_magazzino_permissions(
             detail="Permessi insufficienti",
         )
 
-    db = SessionLocal()
+    db = ReadSessionLocal()
     try:
         users_list = db.query(User).order_by(User.role, User.email).all()
     finally:
@@ -1144,7 +1241,7 @@ def admin_magazzino_permissions_toggle(
 
     db = SessionLocal()
     try:
-        user_to_toggle = db.query(User).filter(User.id == user_id).first()
+        user_to_toggle = db.get(User, user_id)
         if not user_to_toggle:
             raise HTTPException(status_code=404, detail="Utente non trovato")
 
@@ -1163,6 +1260,7 @@ def admin_magazzino_permissions_toggle(
             },
         )
         db.commit()
+        invalidate_current_user_cache()
     except HTTPException:
         db.rollback()
         raise
@@ -1266,11 +1364,12 @@ async def manager_new_user_post(
 
     db = SessionLocal()
     try:
-        existing = db.query(User).filter(User.email == email).first()
+        existing = db.query(User.id).filter(User.email == email).first()
         if existing:
             return render_form("Esiste già un utente con questa email.", status_code=400)
 
-        hashed_password = hash_password(password)
+        # Handler async: l'hash pbkdf2 gira nel threadpool, non nell'event loop.
+        hashed_password = await run_in_threadpool(hash_password, password)
         new_user = User(
             email=email,
             full_name=full_name or None,
@@ -1305,7 +1404,7 @@ async def manager_new_user_post(
 
 
 @app.get("/manager/utenti/{user_id}/modifica", response_class=HTMLResponse)
-async def manager_edit_user_get(
+def manager_edit_user_get(
     request: Request,
     user_id: int,
     current_user: User = Depends(get_current_active_user_html),
@@ -1316,9 +1415,9 @@ async def manager_edit_user_get(
             detail="Permessi insufficienti",
         )
 
-    db = SessionLocal()
+    db = ReadSessionLocal()
     try:
-        user_to_edit = db.query(User).filter(User.id == user_id).first()
+        user_to_edit = db.get(User, user_id)
         if not user_to_edit:
             raise HTTPException(status_code=404, detail="Utente non trovato")
     finally:
@@ -1399,13 +1498,13 @@ async def manager_edit_user_post(
 
     db = SessionLocal()
     try:
-        user_to_edit = db.query(User).filter(User.id == user_id).first()
+        user_to_edit = db.get(User, user_id)
         if not user_to_edit:
             raise HTTPException(status_code=404, detail="Utente non trovato")
         user_obj = user_to_edit
 
         existing = (
-            db.query(User)
+            db.query(User.id)
             .filter(User.email == email, User.id != user_to_edit.id)
             .first()
         )
@@ -1440,6 +1539,7 @@ async def manager_edit_user_post(
         )
 
         db.commit()
+        invalidate_current_user_cache()
     except HTTPException:
         db.rollback()
         raise
@@ -1453,7 +1553,7 @@ async def manager_edit_user_post(
 
 
 @app.post("/manager/utenti/{user_id}/toggle-attivo", response_class=HTMLResponse)
-async def manager_toggle_user_active(
+def manager_toggle_user_active(
     request: Request,
     user_id: int,
     current_user: User = Depends(get_current_active_user_html),
@@ -1466,7 +1566,7 @@ async def manager_toggle_user_active(
 
     db = SessionLocal()
     try:
-        user_to_toggle = db.query(User).filter(User.id == user_id).first()
+        user_to_toggle = db.get(User, user_id)
         if not user_to_toggle:
             raise HTTPException(status_code=404, detail="Utente non trovato")
 
@@ -1489,6 +1589,7 @@ async def manager_toggle_user_active(
             },
         )
         db.commit()
+        invalidate_current_user_cache()
     except HTTPException:
         db.rollback()
         raise
@@ -1505,7 +1606,7 @@ async def manager_toggle_user_active(
 
 
 @app.get("/manager/utenti/{user_id}/reset-password", response_class=HTMLResponse)
-async def manager_reset_password_get(
+def manager_reset_password_get(
     request: Request,
     user_id: int,
     current_user: User = Depends(get_current_active_user_html),
@@ -1516,9 +1617,9 @@ async def manager_reset_password_get(
             detail="Permessi insufficienti",
         )
 
-    db = SessionLocal()
+    db = ReadSessionLocal()
     try:
-        user_to_update = db.query(User).filter(User.id == user_id).first()
+        user_to_update = db.get(User, user_id)
         if not user_to_update:
             raise HTTPException(status_code=404, detail="Utente non trovato")
     finally:
@@ -1567,7 +1668,7 @@ async def manager_reset_password_post(
     if not password:
         db = SessionLocal()
         try:
-            target_user = db.query(User).filter(User.id == user_id).first()
+            target_user = db.get(User, user_id)
             if not target_user:
                 raise HTTPException(status_code=404, detail="Utente non trovato")
         finally:
@@ -1576,15 +1677,18 @@ async def manager_reset_password_post(
 
     db = SessionLocal()
     try:
-        target_user = db.query(User).filter(User.id == user_id).first()
+        target_user = db.get(User, user_id)
         if not target_user:
             raise HTTPException(status_code=404, detail="Utente non trovato")
 
         if password_confirm and password != password_confirm:
             return render_form("Le password non coincidono.")
 
-        target_user.hashed_password = hash_password(password)
+        target_user.hashed_password = await run_in_threadpool(
+            hash_password, password
+        )
         db.commit()
+        invalidate_current_user_cache()
     except HTTPException:
         db.rollback()
         raise
@@ -1608,7 +1712,7 @@ def manager_cantieri(
         raise HTTPException(status_code=403, detail="Permessi insufficienti")
 
     page, per_page = _normalize_pagination(page, per_page)
-    db = SessionLocal()
+    db = ReadSessionLocal()
     try:
         query = (
             db.query(Site)
@@ -1803,7 +1907,7 @@ def manager_site_progress_cordoli(
 
     db = SessionLocal()
     try:
-        site = db.query(Site).filter(Site.id == site_id).first()
+        site = db.get(Site, site_id)
         if not site:
             raise HTTPException(status_code=404, detail="Cantiere non trovato")
 
@@ -1837,7 +1941,7 @@ def manager_site_progress_paratie(
 
     db = SessionLocal()
     try:
-        site = db.query(Site).filter(Site.id == site_id).first()
+        site = db.get(Site, site_id)
         if not site:
             raise HTTPException(status_code=404, detail="Cantiere non trovato")
 
@@ -1935,7 +2039,7 @@ def manager_cantiere_nuovo_get(
 
     site_status_values = get_cached_site_status_values()
     google_maps_api_key = os.getenv("GOOGLE_MAPS_API_KEY")
-    db = SessionLocal()
+    db = ReadSessionLocal()
     try:
         capisquadra = (
             db.query(User)
@@ -2154,7 +2258,7 @@ def manager_site_detail(
         raise HTTPException(status_code=403, detail="Permessi insufficienti")
 
     lang = request.cookies.get("lang", "it")
-    db = SessionLocal()
+    db = ReadSessionLocal()
     try:
         site = _get_site_for_detail(db, site_id, current_user)
         progress_summary, strut_levels_view, strut_levels_count = _build_site_progress(
@@ -2189,7 +2293,7 @@ def manager_cantiere_modifica_get(
 
     google_maps_api_key = os.getenv("GOOGLE_MAPS_API_KEY")
     lang = request.cookies.get("lang", "it")
-    db = SessionLocal()
+    db = ReadSessionLocal()
     try:
         site = (
             db.query(Site)
@@ -2327,7 +2431,7 @@ def manager_cantiere_modifica_post(
 
     db = SessionLocal()
     try:
-        site = db.query(Site).filter(Site.id == site_id).first()
+        site = db.get(Site, site_id)
         if not site:
             raise HTTPException(status_code=404, detail="Cantiere non trovato")
         if is_caposquadra and site.caposquadra_id != current_user.id:
@@ -2409,7 +2513,7 @@ def capo_site_detail(
     if current_user.role != RoleEnum.caposquadra:
         raise HTTPException(status_code=403, detail="Permessi insufficienti")
 
-    db = SessionLocal()
+    db = ReadSessionLocal()
     try:
         site = get_site_for_user(db, site_id, current_user)
     finally:
@@ -2436,31 +2540,14 @@ def capo_dashboard(
     today = date.today()
     start_of_week = today - timedelta(days=today.weekday())
 
-    db = SessionLocal()
+    db = ReadSessionLocal()
     try:
         query_started = time.monotonic()
-        assigned_sites_query = db.query(Site).filter(
-            Site.is_active.is_(True),
-            Site.lat.isnot(None),
-            Site.lng.isnot(None),
-        )
-        assigned_sites_query = scope_sites_query(assigned_sites_query, current_user)
         assigned_sites_with_coords = (
-            assigned_sites_query.options(
-                load_only(
-                    Site.id,
-                    Site.name,
-                    Site.address,
-                    Site.city,
-                    Site.country,
-                    Site.lat,
-                    Site.lng,
-                    Site.status,
-                    Site.is_active,
-                    Site.caposquadra_id,
-                )
+            db.execute(
+                _CAPO_SITES_MAP_STMT.options(*site_scope_options(current_user))
             )
-            .order_by(Site.name)
+            .mappings()
             .all()
         )
         perf_logger.debug(
@@ -2470,57 +2557,39 @@ def capo_dashboard(
         )
         assigned_sites_map_data = _build_sites_map_data(assigned_sites_with_coords)
 
+        # I quattro KPI del caposquadra in una sola SELECT di subquery scalari.
         query_started = time.monotonic()
-        kpi_reports_today = (
-            db.query(func.count(Report.id))
-            .filter(Report.created_by_id == current_user.id)
-            .filter(Report.date == today)
-            .scalar()
-            or 0
-        )
-        perf_logger.debug(
-            "capo_dashboard kpi_reports_today duration_ms=%.2f",
-            (time.monotonic() - query_started) * 1000,
-        )
-
-        query_started = time.monotonic()
-        kpi_hours_this_week = (
-            db.query(func.coalesce(func.sum(Report.total_hours), 0.0))
-            .filter(Report.created_by_id == current_user.id)
-            .filter(Report.date >= start_of_week)
-            .scalar()
-            or 0
-        )
-        perf_logger.debug(
-            "capo_dashboard kpi_hours_this_week duration_ms=%.2f",
-            (time.monotonic() - query_started) * 1000,
-        )
-
-        query_started = time.monotonic()
-        kpi_assigned_sites = (
-            db.query(func.count(Site.id))
-            .filter(Site.caposquadra_id == current_user.id)
-            .filter(Site.is_active.is_(True))
-            .scalar()
-            or 0
-        )
-        perf_logger.debug(
-            "capo_dashboard kpi_assigned_sites duration_ms=%.2f",
-            (time.monotonic() - query_started) * 1000,
-        )
-
-        query_started = time.monotonic()
-        kpi_open_reports = (
-            db.query(func.count(Report.id))
-            .filter(Report.created_by_id == current_user.id)
-            .filter(func.coalesce(Report.total_hours, 0) <= 0)
-            .scalar()
-            or 0
-        )
+        own_reports = select(func.count(Report.id)).where(
+            Report.created_by_id == current_user.id
+        )
+        kpi = db.execute(
+            select(
+                own_reports.where(Report.date == today)
+                .scalar_subquery()
+                .label("reports_today"),
+                select(func.coalesce(func.sum(Report.total_hours), 0.0))
+                .where(Report.created_by_id == current_user.id)
+                .where(Report.date >= start_of_week)
+                .scalar_subquery()
+                .label("hours_this_week"),
+                select(func.count(Site.id))
+                .where(Site.caposquadra_id == current_user.id)
+                .where(Site.is_active.is_(True))
+                .scalar_subquery()
+                .label("assigned_sites"),
+                own_reports.where(func.coalesce(Report.total_hours, 0) <= 0)
+                .scalar_subquery()
+                .label("open_reports"),
+            )
+        ).one()
         perf_logger.debug(
-            "capo_dashboard kpi_open_reports duration_ms=%.2f",
+            "capo_dashboard kpi_counts duration_ms=%.2f",
             (time.monotonic() - query_started) * 1000,
         )
+        kpi_reports_today = kpi.reports_today or 0
+        kpi_hours_this_week = kpi.hours_this_week or 0
+        kpi_assigned_sites = kpi.assigned_sites or 0
+        kpi_open_reports = kpi.open_reports or 0
 
     finally:
         db.close()
@@ -2535,7 +2604,7 @@ def capo_dashboard(
             kpi_hours_this_week=kpi_hours_this_week,
             kpi_assigned_sites=kpi_assigned_sites,
             kpi_open_reports=kpi_open_reports,
-            cantieri_map_data=jsonable_encoder(assigned_sites_map_data),
+            cantieri_map_data=assigned_sites_map_data,
             detail_url_template=str(
                 request.url_for("capo_site_detail", site_id="__SITE_ID__")
             ),
@@ -2554,6 +2623,8 @@ def _get_capo_assigned_sites(db: SessionLocal, capo: User) -> list[Site]:
     )
 
 
+# Sincrona: build_template_context puo' leggere dal database (conteggio
+# notifiche magazzino a cache scaduta), quindi gira nel threadpool.
 @app.get("/capo/rapportini/nuovo", response_class=HTMLResponse)
 def pagina_nuovo_rapportino_capo(
     request: Request,
@@ -2596,7 +2667,7 @@ def capo_fiche_nuova_get(
 
 
 @app.post("/capo/fiches/nuova")
-async def capo_fiche_nuova_post(
+def capo_fiche_nuova_post(
     request: Request,
     current_user: User = Depends(get_current_active_user_html),
     cantiere_id: int = Form(...),
@@ -2643,14 +2714,12 @@ async def capo_fiche_nuova_post(
         try:
             allowed_sites = _get_capo_assigned_sites(db, current_user)
             allowed_site_ids = {s.id for s in allowed_sites}
-            site = db.query(Site).filter(Site.id == cantiere_id).first()
+            site = db.get(Site, cantiere_id)
             if not site or (allowed_site_ids and site.id not in allowed_site_ids):
                 raise HTTPException(status_code=403, detail="Cantiere non valido")
 
             if parsed_machine_id is not None:
-                machine = (
-                    db.query(Machine).filter(Machine.id == parsed_machine_id).first()
-                )
+                machine = db.get(Machine, parsed_machine_id)
                 if not machine:
                     raise HTTPException(status_code=400, detail="Macchinario non trovato")
 
@@ -2675,23 +2744,13 @@ async def capo_fiche_nuova_post(
                 created_by_id=current_user.id,
             )
             db.add(fiche)
-            db.commit()
-            db.refresh(fiche)
-
-            for da_val, a_val, mat in zip(strato_da, strato_a, strato_materiale):
-                if not mat:
-                    continue
-                if da_val is None or a_val is None:
-                    continue
-                if a_val <= da_val:
-                    continue
-                layer = FicheStratigrafia(
-                    fiche_id=fiche.id,
-                    da_profondita=da_val,
-                    a_profondita=a_val,
-                    materiale=mat,
-                )
-                db.add(layer)
+            # Il flush basta a ottenere l'id: fiche e strati vanno in un'unica
+            # transazione, senza il commit e la SELECT di refresh intermedi.
+            db.flush()
+
+            _insert_fiche_strati(
+                db, fiche.id, strato_da, strato_a, strato_materiale
+            )
             db.commit()
         finally:
             db.close()
@@ -2788,7 +2847,7 @@ def manager_fiches(
     if not has_perm(current_user, "manager.access"):
         raise HTTPException(status_code=403, detail="Non autorizzato")
 
-    db = SessionLocal()
+    db = ReadSessionLocal()
 
     parsed_from_date: date | None = None
     parsed_to_date: date | None = None
@@ -2863,7 +2922,7 @@ def manager_fiche_dettaglio(
     if not has_perm(current_user, "manager.access"):
         raise HTTPException(status_code=403, detail="Non autorizzato")
 
-    db = SessionLocal()
+    db = ReadSessionLocal()
     try:
         fiche = (
             db.query(Fiche)
@@ -0,0 +1,20 @@
+-- Indexes on foreign keys and hot filters not covered by 013.
+CREATE INDEX IF NOT EXISTS ix_audit_logs_user_id ON audit_logs (user_id);
+
+CREATE INDEX IF NOT EXISTS ix_machines_site_id ON machines (site_id);
+
+CREATE INDEX IF NOT EXISTS ix_fiches_site_id ON fiches (site_id);
+CREATE INDEX IF NOT EXISTS ix_fiches_machine_id ON fiches (machine_id);
+CREATE INDEX IF NOT EXISTS ix_fiches_created_by_id ON fiches (created_by_id);
+CREATE INDEX IF NOT EXISTS ix_fiche_stratigrafia_fiche_id ON fiche_stratigrafia (fiche_id);
+CREATE INDEX IF NOT EXISTS ix_stratigraphy_layers_fiche_id ON stratigraphy_layers (fiche_id);
+
+CREATE INDEX IF NOT EXISTS ix_magazzino_items_categoria_id ON magazzino_items (categoria_id);
+CREATE INDEX IF NOT EXISTS ix_magazzino_richieste_stato ON magazzino_richieste (stato);
+CREATE INDEX IF NOT EXISTS ix_magazzino_richieste_richiesto_da_user_id ON magazzino_richieste (richiesto_da_user_id);
+CREATE INDEX IF NOT EXISTS ix_magazzino_richieste_cantiere_id ON magazzino_richieste (cantiere_id);
+CREATE INDEX IF NOT EXISTS ix_magazzino_richieste_righe_richiesta_id ON magazzino_richieste_righe (richiesta_id);
+CREATE INDEX IF NOT EXISTS ix_magazzino_richieste_righe_item_id ON magazzino_richieste_righe (item_id);
+CREATE INDEX IF NOT EXISTS ix_magazzino_movimenti_item_id ON magazzino_movimenti (item_id);
+CREATE INDEX IF NOT EXISTS ix_magazzino_movimenti_cantiere_id ON magazzino_movimenti (cantiere_id);
+CREATE INDEX IF NOT EXISTS ix_magazzino_movimenti_riferimento_richiesta_id ON magazzino_movimenti (riferimento_richiesta_id);
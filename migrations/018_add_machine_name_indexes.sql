@@ -0,0 +1,3 @@
+-- Indexes for machine lists ordered by name (all machines and active only).
+CREATE INDEX IF NOT EXISTS ix_machines_name ON machines (name);
+CREATE INDEX IF NOT EXISTS ix_machines_is_active_name ON machines (is_active, name);
@@ -13,10 +13,12 @@ from sqlalchemy import (
     Boolean,
     ForeignKey,
     Enum,
+    Index,
     DateTime,
     CheckConstraint,
     JSON,
     UniqueConstraint,
+    func,
 )
 from sqlalchemy.orm import relationship
 from sqlmodel import SQLModel, Field
@@ -85,12 +87,16 @@ class MagazzinoMovimentoTipoEnum(PyEnum):
 # ------------------------------------------------------------
 
 class TimestampMixin:
+    # server_default allinea lo schema creato da create_all alle migrazioni
+    # (DEFAULT CURRENT_TIMESTAMP). Il default Python resta finche' i database
+    # esistenti, creati senza DEFAULT sulla colonna, non vengono migrati.
     created_at = Column(
-        DateTime, default=datetime.utcnow, nullable=False
+        DateTime, default=datetime.utcnow, server_default=func.now(), nullable=False
     )
     updated_at = Column(
         DateTime,
         default=datetime.utcnow,
+        server_default=func.now(),
         onupdate=datetime.utcnow,
         nullable=False,
     )
@@ -133,9 +139,11 @@ class AuditLog(Base):
     __tablename__ = "audit_logs"
 
     id = Column(Integer, primary_key=True, index=True)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    created_at = Column(
+        DateTime, default=datetime.utcnow, server_default=func.now(), nullable=False
+    )
 
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
     action = Column(String(255), nullable=False)
     target_type = Column("entity", String(255), nullable=False)
     target_id = Column("entity_id", Integer, nullable=True)
@@ -172,7 +180,9 @@ class Notification(Base):
     recipient_role = Column(Enum(RoleEnum), nullable=True)
     target_url = Column(String(255), nullable=True)
     is_read = Column(Boolean, default=False, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    created_at = Column(
+        DateTime, default=datetime.utcnow, server_default=func.now(), nullable=False
+    )
 
     recipient_user = relationship("User")
 
@@ -210,6 +220,8 @@ class Site(Base):
     strut_levels_count = Column(Integer, nullable=True)
 
     caposquadra_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    # Lazy di default: le viste che mostrano il caposquadra lo caricano con
+    # joinedload esplicito, le altre query sui cantieri non fanno JOIN su users.
     caposquadra = relationship("User", back_populates="assigned_sites")
 
     # Relazioni
@@ -223,6 +235,10 @@ class Site(Base):
         order_by="SiteStrutLevel.level_index",
     )
 
+    @property
+    def caposquadra_email(self) -> str | None:
+        return self.caposquadra.email if self.caposquadra else None
+
     def __repr__(self) -> str:
         return f"<Site id={self.id} code={self.code} name={self.name}>"
 
@@ -261,10 +277,14 @@ class SiteStrutLevel(Base):
 
 class Machine(Base, TimestampMixin):
     __tablename__ = "machines"
+    # Liste e select dei macchinari sono ordinate per nome, spesso solo attivi.
+    __table_args__ = (
+        Index("ix_machines_is_active_name", "is_active", "name"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
 
-    name = Column(String(255), nullable=False)
+    name = Column(String(255), nullable=False, index=True)
     code = Column(String(50), unique=True, index=True, nullable=True)
 
     brand = Column(String(255), nullable=True)
@@ -276,7 +296,7 @@ class Machine(Base, TimestampMixin):
     status = Column(String(50), nullable=False, default="attivo")
     notes = Column(Text, nullable=True)
 
-    site_id = Column(Integer, ForeignKey("sites.id"), nullable=True)
+    site_id = Column(Integer, ForeignKey("sites.id"), nullable=True, index=True)
     site = relationship("Site", back_populates="machines")
 
     fiches = relationship("Fiche", back_populates="machine")
@@ -293,6 +313,14 @@ class Machine(Base, TimestampMixin):
 
 class Report(Base, TimestampMixin):
     __tablename__ = "reports"
+    # Stessi indici della migrazione 013, cosi' anche i database creati da
+    # create_all li hanno. Su SQLite idx_reports_date serve anche
+    # ORDER BY date DESC, id DESC: l'indice termina con il rowid (= id).
+    __table_args__ = (
+        Index("idx_reports_site_id", "site_id"),
+        Index("idx_reports_created_by_id", "created_by_id"),
+        Index("idx_reports_date", "date"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
 
@@ -331,13 +359,13 @@ class Fiche(Base, TimestampMixin):
     id = Column(Integer, primary_key=True, index=True)
 
     date = Column(Date, nullable=False)
-    site_id = Column(Integer, ForeignKey("sites.id"), nullable=False)
+    site_id = Column(Integer, ForeignKey("sites.id"), nullable=False, index=True)
     site = relationship("Site", back_populates="fiches")
 
-    machine_id = Column(Integer, ForeignKey("machines.id"), nullable=True)
+    machine_id = Column(Integer, ForeignKey("machines.id"), nullable=True, index=True)
     machine = relationship("Machine", back_populates="fiches")
 
-    created_by_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_by_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     created_by = relationship("User", back_populates="fiches")
 
     fiche_type = Column(Enum(FicheTypeEnum), nullable=False)
@@ -374,7 +402,7 @@ class FicheStratigrafia(Base, TimestampMixin):
     __tablename__ = "fiche_stratigrafia"
 
     id = Column(Integer, primary_key=True, index=True)
-    fiche_id = Column(Integer, ForeignKey("fiches.id"), nullable=False)
+    fiche_id = Column(Integer, ForeignKey("fiches.id"), nullable=False, index=True)
     fiche = relationship("Fiche", back_populates="stratigrafie")
 
     da_profondita = Column(Float, nullable=False)
@@ -396,7 +424,7 @@ class StratigraphyLayer(Base):
     __tablename__ = "stratigraphy_layers"
 
     id = Column(Integer, primary_key=True, index=True)
-    fiche_id = Column(Integer, ForeignKey("fiches.id"), nullable=False)
+    fiche_id = Column(Integer, ForeignKey("fiches.id"), nullable=False, index=True)
     fiche = relationship("Fiche", back_populates="layers")
 
     layer_index = Column(Integer, nullable=False)
@@ -431,7 +459,7 @@ class MagazzinoItem(Base, TimestampMixin):
     codice = Column(String(120), nullable=False, default="")
     descrizione = Column(Text, nullable=True)
     unita_misura = Column(String(50), nullable=False, default="pz")
-    categoria_id = Column(Integer, ForeignKey("magazzino_categorie.id"), nullable=True)
+    categoria_id = Column(Integer, ForeignKey("magazzino_categorie.id"), nullable=True, index=True)
     quantita_disponibile = Column(Float, nullable=False, default=0.0)
     soglia_minima = Column(Float, nullable=True)
     attivo = Column(Boolean, default=True, nullable=False)
@@ -460,10 +488,11 @@ class MagazzinoRichiesta(Base, TimestampMixin):
         Enum(MagazzinoRichiestaStatusEnum),
         nullable=False,
         default=MagazzinoRichiestaStatusEnum.in_attesa,
+        index=True,
     )
 
-    richiesto_da_user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    cantiere_id = Column(Integer, ForeignKey("sites.id"), nullable=True)
+    richiesto_da_user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    cantiere_id = Column(Integer, ForeignKey("sites.id"), nullable=True, index=True)
     note = Column(Text, nullable=True)
     data_necessaria = Column(Date, nullable=True)
 
@@ -490,8 +519,8 @@ class MagazzinoRichiestaRiga(Base):
     __tablename__ = "magazzino_richieste_righe"
 
     id = Column(Integer, primary_key=True, index=True)
-    richiesta_id = Column(Integer, ForeignKey("magazzino_richieste.id"), nullable=False)
-    item_id = Column(Integer, ForeignKey("magazzino_items.id"), nullable=False)
+    richiesta_id = Column(Integer, ForeignKey("magazzino_richieste.id"), nullable=False, index=True)
+    item_id = Column(Integer, ForeignKey("magazzino_items.id"), nullable=False, index=True)
     quantita_richiesta = Column(Float, nullable=False)
     quantita_evasa = Column(Float, nullable=False, default=0.0)
 
@@ -512,12 +541,12 @@ class MagazzinoMovimento(Base, TimestampMixin):
     )
 
     id = Column(Integer, primary_key=True, index=True)
-    item_id = Column(Integer, ForeignKey("magazzino_items.id"), nullable=False)
+    item_id = Column(Integer, ForeignKey("magazzino_items.id"), nullable=False, index=True)
     tipo = Column(Enum(MagazzinoMovimentoTipoEnum), nullable=False)
     quantita = Column(Float, nullable=False)
-    cantiere_id = Column(Integer, ForeignKey("sites.id"), nullable=True)
+    cantiere_id = Column(Integer, ForeignKey("sites.id"), nullable=True, index=True)
     riferimento_richiesta_id = Column(
-        Integer, ForeignKey("magazzino_richieste.id"), nullable=True
+        Integer, ForeignKey("magazzino_richieste.id"), nullable=True, index=True
     )
     creato_da_user_id = Column("user_id", Integer, ForeignKey("users.id"), nullable=True)
     note = Column(Text, nullable=True)
@@ -562,12 +591,18 @@ class PersonalePresenza(SQLModel, table=True):
     hours: Optional[float] = None
     note: Optional[str] = None
     created_at: datetime = Field(
-        sa_column=Column(DateTime, default=datetime.utcnow, nullable=False)
+        sa_column=Column(
+            DateTime,
+            default=datetime.utcnow,
+            server_default=func.now(),
+            nullable=False,
+        )
     )
     updated_at: datetime = Field(
         sa_column=Column(
             DateTime,
             default=datetime.utcnow,
+            server_default=func.now(),
             onupdate=datetime.utcnow,
             nullable=False,
         )
@@ -3,7 +3,7 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Iterable
 
-from sqlalchemy import func, or_
+from sqlalchemy import func, insert, or_
 from sqlalchemy.orm import Session
 
 from models import Notification, RoleEnum, Report, Site, User, MagazzinoRichiesta
@@ -41,21 +41,26 @@ def create_notifications_for_users(
     *,
     target_url: str | None = None,
     exclude_user_id: int | None = None,
-) -> list[Notification]:
-    notifications: list[Notification] = []
-    for user in users:
-        if exclude_user_id is not None and user.id == exclude_user_id:
-            continue
-        notifications.append(
-            create_notification(
-                db,
-                notification_type,
-                message,
-                recipient_user_id=user.id,
-                target_url=target_url,
-            )
-        )
-    return notifications
+) -> int:
+    # Una notifica per destinatario, scritte con un unico INSERT multi-riga
+    # invece di un INSERT per oggetto al flush.
+    created_at = datetime.utcnow()
+    rows = [
+        {
+            "notification_type": notification_type,
+            "message": message,
+            "recipient_user_id": user.id,
+            "recipient_role": None,
+            "target_url": target_url,
+            "created_at": created_at,
+            "is_read": False,
+        }
+        for user in users
+        if exclude_user_id is None or user.id != exclude_user_id
+    ]
+    if rows:
+        db.execute(insert(Notification), rows)
+    return len(rows)
 
 
 def unread_warehouse_notifications_count(db: Session, user: User | None) -> int:
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from collections.abc import Iterable
+from functools import lru_cache
 from typing import FrozenSet
 
 from models import RoleEnum, User
@@ -57,20 +58,28 @@ ROLE_PERMISSIONS: dict[RoleEnum, FrozenSet[str]] = {
     RoleEnum.hr: HR_PERMISSIONS,
 }
 
+# Ruoli operativi ammessi a rapportini, fiche e magazzino di cantiere:
+# frozenset per un controllo di appartenenza a costo costante.
+CAPOSQUADRA_OR_ABOVE_ROLES: FrozenSet[RoleEnum] = frozenset(
+    {RoleEnum.admin, RoleEnum.manager, RoleEnum.caposquadra}
+)
+
+
+# Conversioni stringa -> ruolo precalcolate: evitano RoleEnum(...) con
+# try/except a ogni controllo di permesso.
+_ROLES_BY_VALUE: dict[str, RoleEnum] = {role.value: role for role in RoleEnum}
+_ROLES_BY_NAME: dict[str, RoleEnum] = {role.name: role for role in RoleEnum}
+
 
 def _normalize_role(role: RoleEnum | str | None) -> RoleEnum | None:
     if role is None:
         return None
     if isinstance(role, RoleEnum):
         return role
-    try:
-        return RoleEnum(role)
-    except Exception:
-        try:
-            cleaned_role = str(role).split(".")[-1]
-            return RoleEnum[cleaned_role]
-        except Exception:
-            return None
+    normalized = _ROLES_BY_VALUE.get(role) if isinstance(role, str) else None
+    if normalized is not None:
+        return normalized
+    return _ROLES_BY_NAME.get(str(role).split(".")[-1])
 
 
 def _perm_matches(perm: str, granted: Iterable[str]) -> bool:
@@ -85,11 +94,18 @@ def _perm_matches(perm: str, granted: Iterable[str]) -> bool:
     return False
 
 
+# Il risultato dipende solo da ruolo e permesso (ROLE_PERMISSIONS e' statico):
+# i template chiedono gli stessi permessi a ogni render, e i permessi negati
+# scorrerebbero ogni volta tutti i wildcard concessi.
+@lru_cache(maxsize=1024)
+def _role_has_perm(role: RoleEnum, perm: str) -> bool:
+    return _perm_matches(perm, ROLE_PERMISSIONS.get(role, frozenset()))
+
+
 def has_perm(user: User | None, perm: str) -> bool:
     if not user:
         return False
     role = _normalize_role(getattr(user, "role", None))
     if role is None:
         return False
-    permissions = ROLE_PERMISSIONS.get(role, frozenset())
-    return _perm_matches(perm, permissions)
+    return _role_has_perm(role, perm)
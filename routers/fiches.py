@@ -2,34 +2,70 @@ from datetime import date
 from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session, contains_eager, joinedload, raiseload
 
 from auth import get_current_active_user
-from database import get_db
-from deps import get_site_for_user
+from database import get_db, get_read_db
+from deps import get_site_for_user, scope_sites_query
 from models import Fiche, FicheTypeEnum, RoleEnum, Site, Machine, User
 from schemas import FicheCreate, FicheRead, FicheListItem
+from streaming import stream_json_list
 
 router = APIRouter(prefix="/fiches", tags=["fiches"])
 
 
+def _fiche_list_item(fiche: Fiche) -> FicheListItem:
+    return FicheListItem(
+        id=fiche.id,
+        date=fiche.date,
+        site_name=fiche.site.name if fiche.site else "",
+        machine_name=fiche.machine.name if fiche.machine else None,
+        fiche_type=fiche.fiche_type,
+        operator=fiche.operator,
+        hours=fiche.hours,
+        tipologia_scavo=fiche.tipologia_scavo,
+        stratigrafia=fiche.stratigrafia,
+        materiale=fiche.materiale,
+        profondita_totale=fiche.profondita_totale,
+        diametro_palo=fiche.diametro_palo,
+        larghezza_pannello=fiche.larghezza_pannello,
+        altezza_pannello=fiche.altezza_pannello,
+        data_getto=fiche.data_getto,
+        metri_cubi_gettati=fiche.metri_cubi_gettati,
+        created_by_name=fiche.created_by.full_name or fiche.created_by.email,
+    )
+
+
 @router.get("/", response_model=list[FicheListItem])
 def list_fiches(
     from_date: Optional[date] = None,
     to_date: Optional[date] = None,
     site_id: Optional[int] = None,
     fiche_type: Optional[FicheTypeEnum] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user),
 ):
-    query = db.query(Fiche).join(Site).outerjoin(Machine).join(User)
+    # JOIN espliciti sulle relazioni (users e' raggiungibile sia da fiches sia
+    # da sites) riusati come caricamento: nessuna SELECT lazy per riga, e
+    # raiseload per ogni altra relazione, cosi' un N+1 emerge subito.
+    query = (
+        db.query(Fiche)
+        .join(Fiche.site)
+        .outerjoin(Fiche.machine)
+        .join(Fiche.created_by)
+        .options(
+            contains_eager(Fiche.site).raiseload(Site.caposquadra),
+            contains_eager(Fiche.machine),
+            contains_eager(Fiche.created_by),
+            raiseload("*"),
+        )
+    )
 
     if from_date:
         query = query.filter(Fiche.date >= from_date)
     if to_date:
         query = query.filter(Fiche.date <= to_date)
-    if current_user.role == RoleEnum.caposquadra:
-        query = query.filter(Site.caposquadra_id == current_user.id)
+    query = scope_sites_query(query, current_user)
     if site_id:
         if current_user.role == RoleEnum.caposquadra:
             get_site_for_user(db, site_id, current_user)
@@ -37,36 +73,18 @@ def list_fiches(
     if fiche_type:
         query = query.filter(Fiche.fiche_type == fiche_type)
 
-    fiches = query.order_by(Fiche.date.desc(), Fiche.id.desc()).all()
-
-    return [
-        FicheListItem(
-            id=fiche.id,
-            date=fiche.date,
-            site_name=fiche.site.name if fiche.site else "",
-            machine_name=fiche.machine.name if fiche.machine else None,
-            fiche_type=fiche.fiche_type,
-            operator=fiche.operator,
-            hours=fiche.hours,
-            tipologia_scavo=fiche.tipologia_scavo,
-            stratigrafia=fiche.stratigrafia,
-            materiale=fiche.materiale,
-            profondita_totale=fiche.profondita_totale,
-            diametro_palo=fiche.diametro_palo,
-            larghezza_pannello=fiche.larghezza_pannello,
-            altezza_pannello=fiche.altezza_pannello,
-            data_getto=fiche.data_getto,
-            metri_cubi_gettati=fiche.metri_cubi_gettati,
-            created_by_name=fiche.created_by.full_name or fiche.created_by.email,
-        )
-        for fiche in fiches
-    ]
+    # Righe lette dal cursore e serializzate a blocchi: la memoria resta
+    # limitata anche su intervalli di date molto ampi.
+    return stream_json_list(
+        query.order_by(Fiche.date.desc(), Fiche.id.desc()),
+        _fiche_list_item,
+    )
 
 
 @router.get("/{fiche_id}", response_model=FicheRead)
 def get_fiche_detail(
     fiche_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user),
 ):
     fiche = (
@@ -82,8 +100,13 @@ def get_fiche_detail(
 
     if not fiche:
         raise HTTPException(status_code=404, detail="Fiche non trovata")
-    if current_user.role == RoleEnum.caposquadra:
-        get_site_for_user(db, fiche.site_id, current_user)
+    # Il cantiere e' gia' caricato con la fiche: il controllo di accesso usa
+    # la sua chiave invece di rileggerlo con una seconda query.
+    if (
+        current_user.role == RoleEnum.caposquadra
+        and fiche.site.caposquadra_id != current_user.id
+    ):
+        raise HTTPException(status_code=403, detail="Cantiere non assegnato")
 
     return FicheRead(
         id=fiche.id,
@@ -114,14 +137,14 @@ def get_fiche_detail(
 @router.post("/", response_model=FicheRead)
 def create_fiche(
     fiche_in: FicheCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user),
 ):
     site = get_site_for_user(db, fiche_in.site_id, current_user)
 
     machine = None
     if fiche_in.machine_id is not None:
-        machine = db.query(Machine).filter(Machine.id == fiche_in.machine_id).first()
+        machine = db.get(Machine, fiche_in.machine_id)
         if not machine:
             raise HTTPException(status_code=404, detail="Macchinario non trovato")
 
@@ -146,10 +169,9 @@ def create_fiche(
         created_by_id=current_user.id,
     )
     db.add(fiche)
-    db.commit()
-    db.refresh(fiche)
+    db.flush()
 
-    return FicheRead(
+    response = FicheRead(
         id=fiche.id,
         date=fiche.date,
         site_id=fiche.site_id,
@@ -173,3 +195,5 @@ def create_fiche(
         created_by_name=current_user.full_name or current_user.email,
         created_by_role=current_user.role.value,
     )
+    db.commit()
+    return response
@@ -4,19 +4,23 @@ import time
 from fastapi import APIRouter, Depends, Form, HTTPException, Request
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy import func
-from sqlalchemy.orm import Session, load_only
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, load_only, raiseload
 
 from auth import get_current_active_user_html
-from database import get_db
+from database import get_db, get_read_db
 from models import Machine, MachineTypeEnum, Site
 from schemas import MachineCreate, MachineRead
-from template_context import build_template_context, register_manager_badges
+from template_context import (
+    TEMPLATE_ENV,
+    build_template_context,
+    register_manager_badges,
+)
 from permissions import has_perm
 
 router = APIRouter()
 
-templates = Jinja2Templates(directory="templates")
+templates = Jinja2Templates(env=TEMPLATE_ENV)
 register_manager_badges(templates)
 
 MACHINE_STATUS_CHOICES = ["attivo", "manutenzione", "fuori_servizio"]
@@ -38,7 +42,7 @@ def _require_manager_or_admin(user):
 
 
 def _get_machine_or_404(db: Session, machine_id: int) -> Machine:
-    machine = db.query(Machine).filter(Machine.id == machine_id).first()
+    machine = db.get(Machine, machine_id)
     if not machine:
         raise HTTPException(status_code=404, detail="Macchinario non trovato")
     return machine
@@ -60,7 +64,7 @@ def _parse_site_id(site_id_value: str | None) -> int | None:
 @router.post("/machines", response_model=MachineRead)
 def create_machine_api(
     machine_in: MachineCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     user=Depends(get_current_active_user_html),
 ):
     _require_manager_or_admin(user)
@@ -77,18 +81,28 @@ def create_machine_api(
         site_id=machine_in.site_id,
     )
     db.add(machine)
+    # Dopo il flush l'id e' gia' valorizzato: la risposta si costruisce prima
+    # del commit, che altrimenti scadrebbe gli attributi forzando una SELECT.
+    db.flush()
+    response = MachineRead.model_validate(machine)
     db.commit()
-    db.refresh(machine)
-    return machine
+    return response
 
 
 @router.get("/machines", response_model=list[MachineRead])
 def list_machines_api(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     user=Depends(get_current_active_user_html),
 ):
     _require_manager_or_admin(user)
-    machines = db.query(Machine).order_by(Machine.name.asc()).all()
+    # MachineRead legge solo colonne: ogni relazione toccata per errore in
+    # serializzazione solleva subito invece di fare una SELECT per riga.
+    machines = (
+        db.query(Machine)
+        .options(raiseload("*"))
+        .order_by(Machine.name.asc())
+        .all()
+    )
     return machines
 
 
@@ -106,7 +120,7 @@ def manager_machines_page(
     current_user=Depends(get_current_active_user_html),
     page: int = 1,
     per_page: int = DEFAULT_PER_PAGE,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
 ):
     _require_manager_or_admin(current_user)
 
@@ -140,18 +154,16 @@ def manager_machines_page(
     )
 
     kpi_total = total_count
-    kpi_active = (
-        db.query(func.count(Machine.id))
-        .filter(func.coalesce(Machine.status, "attivo") == "attivo")
-        .scalar()
-        or 0
-    )
-    kpi_oos = (
-        db.query(func.count(Machine.id))
-        .filter(Machine.status == "fuori_servizio")
-        .scalar()
-        or 0
-    )
+    kpi_active, kpi_oos = db.execute(
+        select(
+            select(func.count(Machine.id))
+            .where(func.coalesce(Machine.status, "attivo") == "attivo")
+            .scalar_subquery(),
+            select(func.count(Machine.id))
+            .where(Machine.status == "fuori_servizio")
+            .scalar_subquery(),
+        )
+    ).one()
 
     return templates.TemplateResponse(
         "manager/macchinari_list.html",
@@ -178,7 +190,7 @@ def manager_machines_page(
 def manager_machine_new_get(
     request: Request,
     current_user=Depends(get_current_active_user_html),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
 ):
     _require_manager_or_admin(current_user)
     sites = db.query(Site).filter(Site.is_active == True).order_by(Site.name.asc()).all()  # noqa: E712
@@ -211,7 +223,7 @@ def manager_machine_new_post(
     notes: str | None = Form(None),
     site_id: str | None = Form(None),
     current_user=Depends(get_current_active_user_html),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
 ):
     _require_manager_or_admin(current_user)
 
@@ -253,7 +265,7 @@ def manager_machine_detail(
     request: Request,
     machine_id: int,
     current_user=Depends(get_current_active_user_html),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
 ):
     _require_manager_or_admin(current_user)
     machine = _get_machine_or_404(db, machine_id)
@@ -278,7 +290,7 @@ def manager_machine_edit_get(
     request: Request,
     machine_id: int,
     current_user=Depends(get_current_active_user_html),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
 ):
     _require_manager_or_admin(current_user)
     machine = _get_machine_or_404(db, machine_id)
@@ -316,7 +328,7 @@ def manager_machine_edit_post(
     notes: str | None = Form(None),
     site_id: str | None = Form(None),
     current_user=Depends(get_current_active_user_html),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
 ):
     _require_manager_or_admin(current_user)
     machine = _get_machine_or_404(db, machine_id)
@@ -351,7 +363,7 @@ def manager_machine_assign_get(
     request: Request,
     machine_id: int,
     current_user=Depends(get_current_active_user_html),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
 ):
     _require_manager_or_admin(current_user)
     machine = _get_machine_or_404(db, machine_id)
@@ -375,7 +387,7 @@ def manager_machine_assign_post(
     machine_id: int,
     site_id: str | None = Form(None),
     current_user=Depends(get_current_active_user_html),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
 ):
     _require_manager_or_admin(current_user)
     machine = _get_machine_or_404(db, machine_id)
@@ -8,7 +8,7 @@ from sqlalchemy import or_
 from sqlalchemy.orm import Session
 
 from auth import get_current_active_user_html
-from database import get_db
+from database import get_db, get_read_db
 from models import Notification, User
 
 router = APIRouter(prefix="/api/notifications", tags=["notifications"])
@@ -73,7 +73,7 @@ def _serialize_notification(notification: Notification) -> NotificationListItem:
 
 @router.get("/unread-count", response_model=UnreadCountResponse)
 def unread_count(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     base_query = _notifications_base_query(db, current_user)
@@ -86,7 +86,7 @@ def unread_count(
 @router.get("/list", response_model=NotificationListPayload)
 def list_latest_notifications(
     limit: int = 20,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     limit = max(1, min(limit, 50))
@@ -108,7 +108,7 @@ def list_latest_notifications(
 @router.post("/mark-read", response_model=UnreadCountResponse)
 def mark_notifications_read(
     payload: MarkReadRequest,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     base_query = _notifications_base_query(db, current_user)
@@ -127,9 +127,7 @@ def mark_notifications_read(
             raise HTTPException(status_code=404, detail="Notifica non trovata")
         if not notification.is_read:
             notification.is_read = True
-            db.add(notification)
             db.commit()
-            db.refresh(notification)
     else:
         raise HTTPException(status_code=400, detail="Nessuna notifica selezionata")
     unread_count = (
@@ -142,7 +140,7 @@ def mark_notifications_read(
 def list_notifications(
     unread_only: bool = False,
     limit: int = 20,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     limit = max(1, min(limit, 50))
@@ -168,7 +166,7 @@ def list_notifications(
 
 @router.get("/poll", response_model=NotificationListResponse)
 def poll_notifications(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     base_query = _notifications_base_query(db, current_user)
@@ -189,7 +187,7 @@ def poll_notifications(
 @router.post("/{notification_id}/read", response_model=NotificationOut)
 def mark_notification_read(
     notification_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     notification = (
@@ -201,7 +199,9 @@ def mark_notification_read(
         raise HTTPException(status_code=404, detail="Notifica non trovata")
     if not notification.is_read:
         notification.is_read = True
-        db.add(notification)
+        # Risposta costruita prima del commit: gli attributi sono gia'
+        # caricati, niente SELECT di refresh dopo l'UPDATE.
+        response = NotificationOut.model_validate(notification)
         db.commit()
-        db.refresh(notification)
+        return response
     return notification
@@ -1,25 +1,33 @@
+import hashlib
 from datetime import date as dt_date
 from math import ceil
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel, Field, ConfigDict
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, joinedload, raiseload
 
 from auth import get_current_active_user, get_current_active_user_html
-from database import get_db
+from database import get_db, get_read_db
 from models import RoleEnum, Report, Site, User
 from notifications import notify_new_report
-from permissions import has_perm
-from template_context import build_template_context, register_manager_badges
+from permissions import CAPOSQUADRA_OR_ABOVE_ROLES, has_perm
+from streaming import stream_json_list
+from template_context import (
+    TEMPLATE_ENV,
+    build_template_context,
+    invalidate_manager_dashboard_charts_cache,
+    register_manager_badges,
+)
 
 router = APIRouter(
     prefix="",
     tags=["reports"],
 )
 
-templates = Jinja2Templates(directory="templates")
+templates = Jinja2Templates(env=TEMPLATE_ENV)
 register_manager_badges(templates)
 
 
@@ -66,7 +74,7 @@ class ReportOut(ReportBase):
 )
 def create_report(
     report_in: ReportCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user),
 ):
     """
@@ -78,7 +86,7 @@ def create_report(
     - caposquadra
     """
 
-    if current_user.role not in (RoleEnum.admin, RoleEnum.manager, RoleEnum.caposquadra):
+    if current_user.role not in CAPOSQUADRA_OR_ABOVE_ROLES:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Non hai i permessi per creare un rapportino.",
@@ -98,10 +106,8 @@ def create_report(
     db.add(db_report)
     db.flush()
     notify_new_report(db, db_report, current_user)
-    db.commit()
-    db.refresh(db_report)
 
-    return ReportOut(
+    response = ReportOut(
         id=db_report.id,
         date=db_report.date,
         site_name_or_code=db_report.site_name_or_code,
@@ -117,11 +123,33 @@ def create_report(
             else str(current_user.role)
         ),
     )
+    db.commit()
+    invalidate_manager_dashboard_charts_cache()
+    return response
+
+
+def _report_out(r: Report) -> ReportOut:
+    return ReportOut(
+        id=r.id,
+        date=r.date,
+        site_name_or_code=r.site_name_or_code,
+        total_hours=r.total_hours,
+        workers_count=r.workers_count,
+        machines_used=r.machines_used,
+        activities=r.activities,
+        notes=r.notes,
+        created_by_email=r.created_by.email if r.created_by else None,
+        created_by_role=(
+            r.created_by.role.value
+            if r.created_by and hasattr(r.created_by.role, "value")
+            else None
+        ),
+    )
 
 
 @router.get("/reports", response_model=List[ReportOut])
 def list_reports_for_manager(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user),
 ):
     """
@@ -131,35 +159,45 @@ def list_reports_for_manager(
     - Se sei caposquadra → vedi solo i tuoi
     """
 
-    query = db.query(Report)
+    # Solo il creatore viene serializzato: ogni altra relazione e' vietata.
+    query = db.query(Report).options(
+        joinedload(Report.created_by), raiseload("*")
+    )
 
     if current_user.role == RoleEnum.caposquadra:
         query = query.filter(Report.created_by_id == current_user.id)
 
-    reports = query.order_by(Report.date.desc(), Report.id.desc()).all()
-
-    result: List[ReportOut] = []
-    for r in reports:
-        result.append(
-            ReportOut(
-                id=r.id,
-                date=r.date,
-                site_name_or_code=r.site_name_or_code,
-                total_hours=r.total_hours,
-                workers_count=r.workers_count,
-                machines_used=r.machines_used,
-                activities=r.activities,
-                notes=r.notes,
-                created_by_email=r.created_by.email if r.created_by else None,
-                created_by_role=(
-                    r.created_by.role.value
-                    if r.created_by and hasattr(r.created_by.role, "value")
-                    else None
-                ),
-            )
-        )
+    return stream_json_list(
+        query.order_by(Report.date.desc(), Report.id.desc()),
+        _report_out,
+    )
 
-    return result
+
+def _manager_reports_etag(request: Request, db: Session, user: User) -> str:
+    """
+    ETag della lista rapportini da un solo SELECT di aggregati: cambia con
+    qualunque rapportino aggiunto, rimosso o modificato, con gli utenti
+    (autori e filtro capisquadra), con il numero di cantieri, con l'URL,
+    il cookie lingua e l'utente corrente. Tutto il resto si calcola solo
+    quando la pagina va davvero renderizzata.
+    """
+    version = db.execute(
+        select(
+            func.count(Report.id),
+            func.max(Report.id),
+            func.max(Report.updated_at),
+            select(func.max(User.updated_at)).scalar_subquery(),
+            select(func.count(Site.id)).scalar_subquery(),
+        )
+    ).one()
+    key = (
+        str(request.url),
+        request.cookies.get("lang"),
+        user.id,
+        user.updated_at,
+        tuple(version),
+    )
+    return f'W/"{hashlib.sha1(repr(key).encode()).hexdigest()}"'
 
 
 @router.get("/manager/rapportini", include_in_schema=False)
@@ -171,55 +209,82 @@ def manager_reports_list(
     created_by: int | None = None,
     page: int = 1,
     per_page: int = 20,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     if not (has_perm(current_user, "manager.access") or has_perm(current_user, "reports.read_all")):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Non autorizzato")
 
-    query = db.query(Report)
+    conditions = []
 
     if start_date:
         try:
             parsed_start = dt_date.fromisoformat(start_date)
-            query = query.filter(Report.date >= parsed_start)
+            conditions.append(Report.date >= parsed_start)
         except ValueError:
             start_date = None
 
     if end_date:
         try:
             parsed_end = dt_date.fromisoformat(end_date)
-            query = query.filter(Report.date <= parsed_end)
+            conditions.append(Report.date <= parsed_end)
         except ValueError:
             end_date = None
 
     if site_id:
-        query = query.filter(Report.site_id == site_id)
+        conditions.append(Report.site_id == site_id)
 
     if created_by:
-        query = query.filter(Report.created_by_id == created_by)
+        conditions.append(Report.created_by_id == created_by)
 
     page = max(1, page)
     per_page = max(1, per_page)
 
-    total_reports = query.count()
+    # Back e ricariche della stessa pagina: se nulla e' cambiato basta un 304,
+    # con una sola query di aggregati e senza render del template.
+    etag = _manager_reports_etag(request, db, current_user)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Cookie"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    sites = db.execute(
+        select(Site.id, Site.name, Site.code).order_by(Site.name)
+    ).all()
+    capisquadra = db.execute(
+        select(User.id, User.full_name, User.email)
+        .where(User.role == RoleEnum.caposquadra)
+        .order_by(User.full_name)
+    ).all()
+
+    total_reports = db.scalar(
+        select(func.count(Report.id)).where(*conditions)
+    ) or 0
     total_pages = max(1, ceil(total_reports / per_page))
     offset_value = (page - 1) * per_page
 
-    reports_page = (
-        query.order_by(Report.date.desc(), Report.id.desc())
+    # Solo le colonne mostrate in tabella, con cantiere e autore in join:
+    # righe Core invece di oggetti ORM (niente identity map ne' lazy load).
+    reports_page = db.execute(
+        select(
+            Report.id,
+            Report.date,
+            Report.site_name_or_code,
+            Report.total_hours,
+            Report.workers_count,
+            Report.notes,
+            Report.activities,
+            Site.name.label("site_name"),
+            Site.code.label("site_code"),
+            User.full_name.label("created_by_name"),
+            User.email.label("created_by_email"),
+        )
+        .outerjoin(Site, Report.site_id == Site.id)
+        .outerjoin(User, Report.created_by_id == User.id)
+        .where(*conditions)
+        .order_by(Report.date.desc(), Report.id.desc())
         .offset(offset_value)
         .limit(per_page)
-        .all()
-    )
-
-    sites = db.query(Site).order_by(Site.name).all()
-    capisquadra = (
-        db.query(User)
-        .filter(User.role == RoleEnum.caposquadra)
-        .order_by(User.full_name)
-        .all()
-    )
+    ).all()
 
     return templates.TemplateResponse(
         "manager/rapportini_list.html",
@@ -237,8 +302,9 @@ def manager_reports_list(
                 "created_by": created_by,
             },
             sites=sites,
-            caposquadra=capisquadra,
+            capisquadra=capisquadra,
         ),
+        headers=headers,
     )
 
 
@@ -246,7 +312,7 @@ def manager_reports_list(
 def manager_report_detail(
     report_id: int,
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     if not (has_perm(current_user, "manager.access") or has_perm(current_user, "reports.read_all")):
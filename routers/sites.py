@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 
-from database import get_db
+from database import get_db, get_read_db
 from models import Site
 from schemas import SiteCreate, SiteRead
 from deps import (
@@ -18,7 +18,7 @@ router = APIRouter(prefix="/sites", tags=["sites"])
 @router.post("/", response_model=SiteRead)
 def create_site(
     site_in: SiteCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     user=Depends(require_manager_or_admin),
 ):
     if not has_perm(user, "sites.create"):
@@ -38,12 +38,22 @@ def create_site(
 
 @router.get("/", response_model=list[SiteRead])
 def list_sites(
-    db: Session = Depends(get_db),
+    last_id: int = 0,
+    limit: int = 50,
+    db: Session = Depends(get_read_db, scope="function"),
     user=Depends(require_caposquadra_or_above),
 ):
-    query = db.query(Site)
+    # Paginazione a cursore: la pagina successiva parte dall'id dell'ultimo
+    # cantiere ricevuto, con un seek sulla chiave primaria invece di un OFFSET.
+    limit = max(1, min(limit, 500))
+    query = db.query(Site).options(joinedload(Site.caposquadra))
     query = scope_sites_query(query, user)
-    return query.all()
+    return (
+        query.filter(Site.id > last_id)
+        .order_by(Site.id)
+        .limit(limit)
+        .all()
+    )
 
 
 @router.get("/{site_id}", response_model=SiteRead)
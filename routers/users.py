@@ -1,10 +1,10 @@
 from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr
 from sqlalchemy.orm import Session
 
-from database import get_db
+from database import get_db, get_read_db
 from models import User, RoleEnum
 from permissions import has_perm
 from auth import get_current_active_user, hash_password
@@ -29,8 +29,7 @@ class UserBase(BaseModel):
 class UserOut(UserBase):
     id: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class UserCreate(BaseModel):
@@ -48,11 +47,13 @@ class UserCreate(BaseModel):
 
 @router.get("/", response_model=List[UserOut])
 def list_users(
-    db: Session = Depends(get_db),
+    last_id: int = 0,
+    limit: int = 50,
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user),
 ):
     """
-    Restituisce la lista di tutti gli utenti.
+    Restituisce la lista degli utenti, a pagine di `limit` elementi.
     Accesso consentito agli utenti con permesso di lettura.
     """
     if not (
@@ -64,14 +65,22 @@ def list_users(
             detail="Non hai i permessi per vedere la lista utenti.",
         )
 
-    users = db.query(User).order_by(User.id).all()
+    # Paginazione a cursore sull'id: last_id e' l'ultimo utente ricevuto.
+    limit = max(1, min(limit, 500))
+    users = (
+        db.query(User)
+        .filter(User.id > last_id)
+        .order_by(User.id)
+        .limit(limit)
+        .all()
+    )
     return users
 
 
 @router.post("/", response_model=UserOut, status_code=status.HTTP_201_CREATED)
 def create_user(
     user_in: UserCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user),
 ):
     """
@@ -85,7 +94,7 @@ def create_user(
         )
 
     # Controllo se l'email esiste già
-    existing = db.query(User).filter(User.email == user_in.email).first()
+    existing = db.query(User.id).filter(User.email == user_in.email).first()
     if existing:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -107,10 +116,11 @@ def create_user(
     )
 
     db.add(db_user)
+    db.flush()
+    response = UserOut.model_validate(db_user)
     db.commit()
-    db.refresh(db_user)
 
-    return db_user
+    return response
 
 
 @router.get("/me", response_model=UserOut)
@@ -8,13 +8,13 @@ from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session, joinedload
 
 from auth import get_current_active_user_html
-from database import get_db
+from database import get_read_db
 from models import AuditLog, User, RoleEnum
-from template_context import register_manager_badges, render_template
+from template_context import TEMPLATE_ENV, register_manager_badges, render_template
 from permissions import has_perm
 
 
-templates = Jinja2Templates(directory="templates")
+templates = Jinja2Templates(env=TEMPLATE_ENV)
 register_manager_badges(templates)
 router = APIRouter(tags=["audit"])
 
@@ -45,7 +45,7 @@ def manager_audit_list(
     user_id: int | None = None,
     date_from: str | None = None,
     date_to: str | None = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     _ensure_admin_or_manager(current_user)
@@ -107,7 +107,7 @@ def admin_audit_list(
     user_id: int | None = None,
     date_from: str | None = None,
     date_to: str | None = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     _ensure_admin(current_user)
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import stat
 from datetime import datetime
 
 from fastapi import APIRouter, Depends, HTTPException, Request
@@ -10,13 +11,13 @@ from sqlalchemy.orm import Session
 from audit_utils import log_audit_event
 from auth import get_current_active_user_html
 from backup_utils import create_database_backup, get_backup_path, list_backups
-from database import get_db
+from database import get_db, get_read_db
 from models import User
-from template_context import register_manager_badges, render_template
+from template_context import TEMPLATE_ENV, register_manager_badges, render_template
 from permissions import has_perm
 
 
-templates = Jinja2Templates(directory="templates")
+templates = Jinja2Templates(env=TEMPLATE_ENV)
 register_manager_badges(templates)
 router = APIRouter(tags=["backup"])
 
@@ -33,7 +34,7 @@ def _ensure_admin(user: User) -> None:
 )
 def backup_export_page(
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     _ensure_admin(current_user)
@@ -57,7 +58,7 @@ def backup_export_page(
 )
 def backup_export_run(
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     _ensure_admin(current_user)
@@ -88,11 +89,19 @@ def backup_export_download(
     current_user: User = Depends(get_current_active_user_html),
 ):
     _ensure_admin(current_user)
-    backup_path = get_backup_path(filename)
-    if not backup_path.exists():
+    # Lo stat serve sia al controllo di esistenza sia agli header della
+    # risposta: FileResponse lo riusa invece di ripeterlo nel threadpool.
+    # lstat: un symlink non e' un file regolare e viene rifiutato.
+    try:
+        backup_path = get_backup_path(filename)
+        backup_stat = backup_path.lstat()
+    except (ValueError, FileNotFoundError):
+        raise HTTPException(status_code=404, detail="Backup non trovato")
+    if not stat.S_ISREG(backup_stat.st_mode):
         raise HTTPException(status_code=404, detail="Backup non trovato")
     return FileResponse(
         backup_path,
         filename=backup_path.name,
         media_type="application/octet-stream",
+        stat_result=backup_stat,
     )
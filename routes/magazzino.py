@@ -13,7 +13,7 @@ from sqlalchemy import func, or_
 from sqlalchemy.orm import Session, joinedload, selectinload
 
 from auth import get_current_active_user_html
-from database import get_db
+from database import get_db, get_read_db
 from models import (
     MagazzinoCategoria,
     MagazzinoItem,
@@ -23,22 +23,22 @@ from models import (
     MagazzinoRichiestaRiga,
     MagazzinoRichiestaPrioritaEnum,
     MagazzinoRichiestaStatusEnum,
-    RoleEnum,
     Site,
     User,
 )
 from audit_utils import log_audit_event
 from template_context import (
+    TEMPLATE_ENV,
     get_lang_from_request,
     invalidate_manager_badges_cache,
     register_manager_badges,
     render_template,
 )
-from permissions import has_perm
+from permissions import CAPOSQUADRA_OR_ABOVE_ROLES, has_perm
 from notifications import notify_magazzino_richiesta
 
 
-templates = Jinja2Templates(directory="templates")
+templates = Jinja2Templates(env=TEMPLATE_ENV)
 register_manager_badges(templates)
 router = APIRouter(tags=["magazzino"])
 
@@ -59,7 +59,7 @@ MAX_PER_PAGE = 100
 
 
 def ensure_caposquadra_or_manager(user: User) -> None:
-    if user.role not in (RoleEnum.admin, RoleEnum.manager, RoleEnum.caposquadra):
+    if user.role not in CAPOSQUADRA_OR_ABOVE_ROLES:
         raise HTTPException(status_code=403, detail="Permessi insufficienti")
 
 
@@ -346,7 +346,7 @@ def capo_magazzino_list(
     categoria: str | None = None,
     sotto_soglia: int | None = None,
     esauriti: int | None = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_caposquadra_or_manager(current_user)
@@ -439,7 +439,7 @@ def capo_magazzino_richieste(
     request: Request,
     page: int = 1,
     per_page: int = DEFAULT_PER_PAGE,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_caposquadra_or_manager(current_user)
@@ -497,7 +497,7 @@ def capo_magazzino_richieste(
 def capo_magazzino_richiesta_letto(
     richiesta_id: int,
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_caposquadra_or_manager(current_user)
@@ -536,7 +536,7 @@ def capo_magazzino_richiesta_letto(
 )
 def capo_magazzino_richiesta_new(
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_caposquadra_or_manager(current_user)
@@ -571,7 +571,7 @@ def capo_magazzino_richiesta_create(
     note: str = Form(""),
     priorita: str = Form("MED"),
     data_necessaria: str = Form(""),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_caposquadra_or_manager(current_user)
@@ -641,7 +641,7 @@ def capo_magazzino_richiesta_create(
 )
 def manager_magazzino_dashboard(
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
@@ -719,7 +719,7 @@ def manager_magazzino_list(
     attivi: int | None = None,
     sotto_soglia: int | None = None,
     esauriti: int | None = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
@@ -892,7 +892,7 @@ def _render_magazzino_items_list(
 )
 def manager_magazzino_sotto_soglia(
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
@@ -946,7 +946,7 @@ def manager_magazzino_sotto_soglia(
 )
 def manager_magazzino_sotto_soglia_crea_richiesta(
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
@@ -1008,7 +1008,7 @@ def manager_magazzino_richiesta_draft_sotto_soglia(
     request: Request,
     item_id: list[str] = Form([]),
     quantita: list[str] = Form([]),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
@@ -1081,7 +1081,7 @@ def manager_magazzino_movimenti(
     export: str | None = None,
     page: int = 1,
     per_page: int = DEFAULT_PER_PAGE,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
@@ -1253,7 +1253,7 @@ def manager_magazzino_report_consumi(
     date_from: str | None = None,
     date_to: str | None = None,
     export: str | None = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
@@ -1261,7 +1261,7 @@ def manager_magazzino_report_consumi(
     if not cantiere_id:
         raise HTTPException(status_code=400, detail="Cantiere obbligatorio")
 
-    cantiere = db.query(Site).filter(Site.id == cantiere_id).first()
+    cantiere = db.get(Site, cantiere_id)
     if not cantiere:
         raise HTTPException(status_code=404, detail="Cantiere non trovato")
 
@@ -1335,7 +1335,7 @@ def manager_magazzino_report_consumi(
 )
 def manager_magazzino_categorie_list(
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
@@ -1400,7 +1400,7 @@ def manager_magazzino_categorie_create(
     icon: str | None = Form(""),
     color: str | None = Form(""),
     attiva: bool = Form(False),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
@@ -1424,7 +1424,7 @@ def manager_magazzino_categorie_create(
             current_user,
         )
     existing = (
-        db.query(MagazzinoCategoria)
+        db.query(MagazzinoCategoria.id)
         .filter(func.lower(MagazzinoCategoria.nome) == nome_value.lower())
         .first()
     )
@@ -1536,15 +1536,11 @@ def manager_magazzino_categorie_create(
 def manager_magazzino_categorie_edit(
     categoria_id: int,
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
-    categoria = (
-        db.query(MagazzinoCategoria)
-        .filter(MagazzinoCategoria.id == categoria_id)
-        .first()
-    )
+    categoria = db.get(MagazzinoCategoria, categoria_id)
     if not categoria:
         return RedirectResponse(
             url=request.url_for("manager_magazzino_categorie_list"),
@@ -1580,16 +1576,12 @@ def manager_magazzino_categorie_update(
     icon: str | None = Form(""),
     color: str | None = Form(""),
     attiva: bool = Form(False),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
     lang = get_lang_from_request(request)
-    categoria = (
-        db.query(MagazzinoCategoria)
-        .filter(MagazzinoCategoria.id == categoria_id)
-        .first()
-    )
+    categoria = db.get(MagazzinoCategoria, categoria_id)
     if not categoria:
         return RedirectResponse(
             url=request.url_for("manager_magazzino_categorie_list"),
@@ -1614,7 +1606,7 @@ def manager_magazzino_categorie_update(
             current_user,
         )
     existing = (
-        db.query(MagazzinoCategoria)
+        db.query(MagazzinoCategoria.id)
         .filter(
             func.lower(MagazzinoCategoria.nome) == nome_value.lower(),
             MagazzinoCategoria.id != categoria.id,
@@ -1721,15 +1713,11 @@ def manager_magazzino_categorie_update(
 def manager_magazzino_categorie_disable(
     categoria_id: int,
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
-    categoria = (
-        db.query(MagazzinoCategoria)
-        .filter(MagazzinoCategoria.id == categoria_id)
-        .first()
-    )
+    categoria = db.get(MagazzinoCategoria, categoria_id)
     if categoria:
         categoria.attiva = False
         db.add(categoria)
@@ -1749,15 +1737,11 @@ def manager_magazzino_categorie_disable(
 def manager_magazzino_categorie_toggle(
     categoria_id: int,
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
-    categoria = (
-        db.query(MagazzinoCategoria)
-        .filter(MagazzinoCategoria.id == categoria_id)
-        .first()
-    )
+    categoria = db.get(MagazzinoCategoria, categoria_id)
     if categoria:
         categoria.attiva = not categoria.attiva
         db.add(categoria)
@@ -1788,7 +1772,7 @@ def manager_magazzino_categorie_toggle(
 def manager_magazzino_categorie_up(
     categoria_id: int,
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
@@ -1813,7 +1797,7 @@ def manager_magazzino_categorie_up(
 def manager_magazzino_categorie_down(
     categoria_id: int,
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
@@ -1838,7 +1822,7 @@ def manager_magazzino_categorie_down(
 def manager_magazzino_new(
     request: Request,
     current_user: User = Depends(get_current_active_user_html),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
 ):
     ensure_magazzino_manager(current_user)
     categorie, fallback_categoria, fallback_categoria_id = _load_categorie(
@@ -1882,7 +1866,7 @@ def manager_magazzino_create(
     quantita_disponibile: str | None = Form(""),
     soglia_minima: str | None = Form(""),
     attivo: bool = Form(False),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
@@ -1953,11 +1937,11 @@ def manager_magazzino_create(
 def manager_magazzino_edit(
     item_id: int,
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
-    item = db.query(MagazzinoItem).filter(MagazzinoItem.id == item_id).first()
+    item = db.get(MagazzinoItem, item_id)
     if not item:
         return RedirectResponse(
             url=request.url_for("manager_magazzino_list"),
@@ -2001,12 +1985,12 @@ def manager_magazzino_update(
     quantita_disponibile: str | None = Form(""),
     soglia_minima: str | None = Form(""),
     attivo: bool = Form(False),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
     lang = get_lang_from_request(request)
-    item = db.query(MagazzinoItem).filter(MagazzinoItem.id == item_id).first()
+    item = db.get(MagazzinoItem, item_id)
     if not item:
         return RedirectResponse(
             url=request.url_for("manager_magazzino_list"),
@@ -2144,7 +2128,7 @@ def manager_magazzino_update(
 def manager_magazzino_duplicate(
     item_id: int,
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
@@ -2183,7 +2167,7 @@ def manager_magazzino_duplicate_create(
     request: Request,
     codice: str = Form(...),
     quantita_iniziale: str | None = Form(""),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
@@ -2213,7 +2197,7 @@ def manager_magazzino_duplicate_create(
             current_user,
         )
     existing = (
-        db.query(MagazzinoItem)
+        db.query(MagazzinoItem.id)
         .filter(func.lower(MagazzinoItem.codice) == codice_value.lower())
         .first()
     )
@@ -2300,11 +2284,11 @@ def manager_magazzino_duplicate_create(
 def manager_magazzino_preferito_toggle(
     item_id: int,
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
-    item = db.query(MagazzinoItem).filter(MagazzinoItem.id == item_id).first()
+    item = db.get(MagazzinoItem, item_id)
     if not item:
         return RedirectResponse(
             url=f"{request.url_for('manager_magazzino_list')}?err=item_non_trovato",
@@ -2339,13 +2323,13 @@ def manager_magazzino_scarico(
     quantita: str = Form(...),
     cantiere_id: int | None = Form(None),
     note: str = Form(""),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
     lang = get_lang_from_request(request)
     try:
-        item = db.query(MagazzinoItem).filter(MagazzinoItem.id == item_id).first()
+        item = db.get(MagazzinoItem, item_id)
         if not item:
             raise ValueError(_magazzino_error_message(lang, "item_non_trovato"))
 
@@ -2419,13 +2403,13 @@ def manager_magazzino_carico_rapido(
     request: Request,
     quantita: str = Form(...),
     note: str = Form(""),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
     lang = get_lang_from_request(request)
     try:
-        item = db.query(MagazzinoItem).filter(MagazzinoItem.id == item_id).first()
+        item = db.get(MagazzinoItem, item_id)
         if not item:
             raise ValueError(_magazzino_error_message(lang, "item_non_trovato"))
 
@@ -2493,13 +2477,13 @@ def manager_magazzino_scarico_rapido(
     quantita: str = Form(...),
     note: str = Form(""),
     cantiere_id: int | None = Form(None),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
     lang = get_lang_from_request(request)
     try:
-        item = db.query(MagazzinoItem).filter(MagazzinoItem.id == item_id).first()
+        item = db.get(MagazzinoItem, item_id)
         if not item:
             raise ValueError(_magazzino_error_message(lang, "item_non_trovato"))
 
@@ -2570,13 +2554,13 @@ def manager_magazzino_scarico_rapido(
 def manager_magazzino_delete(
     item_id: int,
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
     if not has_perm(current_user, "records.delete"):
         raise HTTPException(status_code=403, detail="Permessi insufficienti")
-    item = db.query(MagazzinoItem).filter(MagazzinoItem.id == item_id).first()
+    item = db.get(MagazzinoItem, item_id)
     if item:
         item.attivo = False
         db.add(item)
@@ -2599,7 +2583,7 @@ def manager_magazzino_richieste(
     stato: str | None = None,
     page: int = 1,
     per_page: int = DEFAULT_PER_PAGE,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
@@ -2654,7 +2638,7 @@ def manager_magazzino_richieste(
 def manager_magazzino_richiesta_detail(
     richiesta_id: int,
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
@@ -2696,7 +2680,7 @@ def manager_magazzino_richiesta_approva(
     richiesta_id: int,
     request: Request,
     risposta_manager: str = Form(""),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
@@ -2787,7 +2771,7 @@ def manager_magazzino_richiesta_approva(
 async def manager_magazzino_richiesta_evadi(
     richiesta_id: int,
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
@@ -3010,12 +2994,12 @@ def manager_magazzino_richiesta_rifiuta(
     richiesta_id: int,
     request: Request,
     risposta_manager: str = Form(""),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     ensure_magazzino_manager(current_user)
     lang = get_lang_from_request(request)
-    richiesta = db.query(MagazzinoRichiesta).filter(MagazzinoRichiesta.id == richiesta_id).first()
+    richiesta = db.get(MagazzinoRichiesta, richiesta_id)
     if not richiesta:
         return RedirectResponse(
             url=request.url_for("manager_magazzino_richieste"),
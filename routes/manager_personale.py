@@ -11,18 +11,18 @@ from sqlmodel import Session, select
 from sqlalchemy import func
 
 from auth import get_current_active_user_html
-from database import get_session
+from database import get_read_session, get_session
 from models import Personale, PersonalePresenza, Site, User
 from personale_presenze_repository import (
     copy_week_attendance_from_monday,
     get_week_attendance,
     upsert_personale_presenza,
 )
-from template_context import register_manager_badges, render_template
+from template_context import TEMPLATE_ENV, register_manager_badges, render_template
 from permissions import has_perm
 
 
-templates = Jinja2Templates(directory="templates")
+templates = Jinja2Templates(env=TEMPLATE_ENV)
 register_manager_badges(templates)
 router = APIRouter(tags=["manager-personale"])
 DEFAULT_PER_PAGE = 50
@@ -124,7 +124,7 @@ def manager_personale_list(
     request: Request,
     page: int = 1,
     per_page: int = DEFAULT_PER_PAGE,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     if not has_perm(current_user, "users.read"):
@@ -202,7 +202,7 @@ def manager_personale_create(
     data_assunzione: Optional[date] = Form(None),
     attivo: bool = Form(False),
     note: str = Form(""),
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_session, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     _ensure_manager(current_user)
@@ -232,7 +232,7 @@ def manager_personale_create(
 def manager_personale_edit(
     request: Request,
     personale_id: int,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     _ensure_manager(current_user)
@@ -272,7 +272,7 @@ def manager_personale_update(
     data_assunzione: Optional[date] = Form(None),
     attivo: bool = Form(False),
     note: str = Form(""),
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_session, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     _ensure_manager(current_user)
@@ -307,7 +307,7 @@ def manager_personale_update(
 def manager_personale_delete(
     request: Request,
     personale_id: int,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_session, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     _ensure_manager(current_user)
@@ -339,7 +339,7 @@ def manager_personale_presenze(
     week_start: Optional[date] = Query(None),
     autofill: str | None = None,
     autofill_personale: Optional[int] = None,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     _ensure_manager(current_user)
@@ -632,7 +632,7 @@ def manager_personale_presenze_day_update(
     site_id: str = Form(""),
     hours: str = Form(""),
     month: str = Form(""),
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_session, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     _ensure_manager(current_user)
@@ -686,7 +686,7 @@ def manager_personale_presenze_update(
     hours: str = Form(""),
     week_start: str = Form(""),
     personale_filter: str = Form(""),
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_session, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     _ensure_manager(current_user)
@@ -731,7 +731,7 @@ def manager_personale_presenze_autofill(
     week_start: str = Form(...),
     overwrite: bool = Form(False),
     personale_filter: str = Form(""),
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_session, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     _ensure_manager(current_user)
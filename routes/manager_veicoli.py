@@ -9,13 +9,13 @@ from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 from auth import get_current_active_user_html
-from database import get_db
+from database import get_db, get_read_db
 from models import User, Personale
 from models.veicoli import Veicolo
-from template_context import register_manager_badges, render_template
+from template_context import TEMPLATE_ENV, register_manager_badges, render_template
 from permissions import has_perm
 
-templates = Jinja2Templates(directory="templates")
+templates = Jinja2Templates(env=TEMPLATE_ENV)
 register_manager_badges(templates)
 router = APIRouter(tags=["manager-veicoli"])
 DEFAULT_PER_PAGE = 50
@@ -62,7 +62,7 @@ def manager_veicoli_list(
     request: Request,
     page: int = 1,
     per_page: int = DEFAULT_PER_PAGE,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     """
@@ -109,7 +109,7 @@ def manager_veicoli_list(
 )
 def manager_veicoli_new(
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     """
@@ -150,7 +150,7 @@ def manager_veicoli_create(
     assicurazione_scadenza: str | None = Form(None),
     revisione_scadenza: str | None = Form(None),
     assegnato_a_id: str | None = Form(None),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     """
@@ -187,14 +187,14 @@ def manager_veicoli_create(
 def manager_veicoli_edit(
     veicolo_id: int,
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     """
     Form modifica veicolo esistente.
     """
     _ensure_manager(current_user)
-    veicolo = db.query(Veicolo).filter(Veicolo.id == veicolo_id).first()
+    veicolo = db.get(Veicolo, veicolo_id)
     if not veicolo:
         return RedirectResponse(
             url=request.url_for("manager_veicoli_list"),
@@ -238,14 +238,14 @@ def manager_veicoli_update(
     assicurazione_scadenza: str | None = Form(None),
     revisione_scadenza: str | None = Form(None),
     assegnato_a_id: str | None = Form(None),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     """
     Aggiornamento veicolo esistente.
     """
     _ensure_manager(current_user)
-    veicolo = db.query(Veicolo).filter(Veicolo.id == veicolo_id).first()
+    veicolo = db.get(Veicolo, veicolo_id)
     if not veicolo:
         return RedirectResponse(
             url=request.url_for("manager_veicoli_list"),
@@ -281,7 +281,7 @@ def manager_veicoli_update(
 def manager_veicoli_delete(
     veicolo_id: int,
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     """
@@ -290,7 +290,7 @@ def manager_veicoli_delete(
     _ensure_manager(current_user)
     if not has_perm(current_user, "records.delete"):
         raise HTTPException(status_code=403, detail="Permessi insufficienti")
-    veicolo = db.query(Veicolo).filter(Veicolo.id == veicolo_id).first()
+    veicolo = db.get(Veicolo, veicolo_id)
     if veicolo:
         db.delete(veicolo)
         db.commit()
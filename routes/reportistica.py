@@ -12,7 +12,7 @@ from sqlalchemy import case, func
 from sqlalchemy.orm import Session
 
 from auth import get_current_active_user_html
-from database import get_db
+from database import get_read_db
 from models import (
     Fiche,
     FicheTypeEnum,
@@ -23,11 +23,11 @@ from models import (
     User,
 )
 from permissions import has_perm
-from template_context import render_template, register_manager_badges
+from template_context import TEMPLATE_ENV, render_template, register_manager_badges
 
 
 router = APIRouter(tags=["manager-reports"])
-templates = Jinja2Templates(directory="templates")
+templates = Jinja2Templates(env=TEMPLATE_ENV)
 register_manager_badges(templates)
 
 REPORT_TYPES = {
@@ -273,7 +273,7 @@ def manager_reports_dashboard(
     date_from: str | None = None,
     date_to: str | None = None,
     preset: str | None = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     _ensure_manager(current_user)
@@ -327,7 +327,7 @@ def manager_reports_export(
     date_from: str | None = None,
     date_to: str | None = None,
     preset: str | None = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db, scope="function"),
     current_user: User = Depends(get_current_active_user_html),
 ):
     _ensure_manager(current_user)
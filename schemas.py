@@ -24,8 +24,7 @@ class UserRead(UserBase):
     role: RoleEnum
     is_active: bool
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # ---------- AUTH ----------
@@ -56,9 +55,10 @@ class SiteCreate(SiteBase):
 
 class SiteRead(SiteBase):
     id: int
+    caposquadra_id: Optional[int] = None
+    caposquadra_email: Optional[str] = None
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # ---------- MACCHINARI ----------
@@ -111,8 +111,7 @@ class DailyReportRead(DailyReportBase):
     id: int
     author_id: int
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # ---------- FICHES + STRATIGRAFIA ----------
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import logging
+from collections.abc import Callable, Iterator
+from itertools import islice
+from typing import Any
+
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy.orm import Query, Session
+
+from database import ReadSessionLocal
+
+logger = logging.getLogger("lenta_france_gestionale.errors")
+
+# Righe lette dal cursore (e serializzate) per blocco: memoria O(blocco)
+# invece di O(righe), e un solo invio ASGI per blocco.
+STREAM_BATCH_SIZE = 500
+
+
+def _next_batch(
+    rows: Iterator[Any], serialize: Callable[[Any], BaseModel]
+) -> list[bytes]:
+    return [
+        serialize(row).model_dump_json(by_alias=True).encode()
+        for row in islice(rows, STREAM_BATCH_SIZE)
+    ]
+
+
+def _iter_json_array(
+    db: Session,
+    rows: Iterator[Any],
+    first_batch: list[bytes],
+    serialize: Callable[[Any], BaseModel],
+) -> Iterator[bytes]:
+    # Stato 200 e "[" sono gia' partiti: un errore da qui in poi non puo'
+    # diventare un 500. Lo si registra e si rilancia, cosi' il server chiude
+    # la connessione invece di terminare il corpo con un JSON troncato.
+    try:
+        yield b"[" + b",".join(first_batch)
+        while batch := _next_batch(rows, serialize):
+            yield b"," + b",".join(batch)
+        yield b"]"
+    except Exception:
+        logger.exception("Errore durante lo streaming di una lista JSON")
+        raise
+    finally:
+        db.close()
+
+
+def stream_json_list(
+    query: Query, serialize: Callable[[Any], BaseModel]
+) -> StreamingResponse:
+    """Restituisce i risultati della query come array JSON, a blocchi.
+
+    Il primo blocco viene letto prima di rispondere: errori di query o di
+    serializzazione iniziali producono ancora un normale 500.
+    """
+    # La sessione della richiesta si chiude al ritorno dell'handler: lo
+    # stream usa una propria sessione di lettura, chiusa a fine iterazione
+    # (anche se il client si disconnette).
+    db = ReadSessionLocal()
+    try:
+        rows = iter(query.with_session(db).yield_per(STREAM_BATCH_SIZE))
+        first_batch = _next_batch(rows, serialize)
+    except Exception:
+        db.close()
+        raise
+    return StreamingResponse(
+        _iter_json_array(db, rows, first_batch, serialize),
+        media_type="application/json",
+    )
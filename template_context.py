@@ -1,18 +1,27 @@
 from __future__ import annotations
 
-import time
+import os
+from datetime import date, timedelta
 from pathlib import Path
-from threading import Lock
 
 from fastapi import Request
+from jinja2 import (
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    select_autoescape,
+)
 from sqlalchemy import func
 
-from database import SessionLocal
+from cache_utils import TTLCache
+from database import ReadSessionLocal
 from models import (
     MagazzinoItem,
     MagazzinoRichiesta,
     MagazzinoRichiestaStatusEnum,
+    Report,
     RoleEnum,
+    Site,
     SiteStatusEnum,
     User,
 )
@@ -30,44 +39,19 @@ def _can_view_manager_badges(user: User | None) -> bool:
     )
 
 
-class _SimpleTTLCache:
-    def __init__(self) -> None:
-        self._data: dict[str, tuple[object, float]] = {}
-        self._lock = Lock()
-
-    def get(self, key: str) -> object | None:
-        now = time.monotonic()
-        with self._lock:
-            value = self._data.get(key)
-            if not value:
-                return None
-            cached_value, expires_at = value
-            if expires_at < now:
-                self._data.pop(key, None)
-                return None
-            return cached_value
-
-    def set(self, key: str, value: object, ttl_seconds: int) -> None:
-        expires_at = time.monotonic() + ttl_seconds
-        with self._lock:
-            self._data[key] = (value, expires_at)
-
-    def invalidate(self, key: str) -> None:
-        with self._lock:
-            self._data.pop(key, None)
-
-
-_CACHE = _SimpleTTLCache()
+_CACHE = TTLCache()
 
 _CACHE_KEY_NUOVE_RICHIESTE = "nuove_richieste_count"
 _CACHE_KEY_MANAGER_BADGES = "manager_badge_counts"
 _CACHE_KEY_SITE_STATUSES = "site_status_values"
 _CACHE_KEY_ROLE_CHOICES = "role_choices"
 _CACHE_KEY_WAREHOUSE_NOTIFICATIONS = "warehouse_unread_notifications"
+_CACHE_KEY_MANAGER_DASHBOARD_CHARTS = "manager_dashboard_charts"
 
 _CACHE_TTL_SHORT = 30
 _CACHE_TTL_MEDIUM = 120
 _CACHE_TTL_LONG = 600
+_CACHE_TTL_DASHBOARD_CHARTS = 60
 
 
 def get_numero_richieste_nuove(db) -> int:
@@ -91,7 +75,7 @@ def get_cached_nuove_richieste_count(request: Request, db=None) -> int:
 
     close_db = False
     if db is None:
-        db = SessionLocal()
+        db = ReadSessionLocal()
         close_db = True
     try:
         count = int(get_numero_richieste_nuove(db) or 0)
@@ -120,7 +104,7 @@ def get_cached_warehouse_notifications_count(
 
     close_db = False
     if db is None:
-        db = SessionLocal()
+        db = ReadSessionLocal()
         close_db = True
     try:
         count = int(unread_warehouse_notifications_count(db, user) or 0)
@@ -161,11 +145,21 @@ def render_template(
     return templates.TemplateResponse(template_name, template_context, **response_kwargs)
 
 
+SUPPORTED_LANGUAGES = frozenset({"it", "fr"})
+DEFAULT_LANGUAGE = "it"
+
+
 def get_lang_from_request(request: Request) -> str:
+    # Risolta una volta per richiesta: handler e build_template_context la
+    # chiedono entrambi, ma il cookie non cambia durante la richiesta.
+    cached = getattr(request.state, "lang", None)
+    if cached is not None:
+        return cached
     lang = request.cookies.get("lang")
-    if lang in ("it", "fr"):
-        return lang
-    return "it"
+    if lang not in SUPPORTED_LANGUAGES:
+        lang = DEFAULT_LANGUAGE
+    request.state.lang = lang
+    return lang
 
 
 def build_template_context(
@@ -204,7 +198,7 @@ def manager_badge_counts(request: Request, user: User | None = None) -> dict[str
         request.state.manager_badge_counts = cached_global
         return cached_global
 
-    db = SessionLocal()
+    db = ReadSessionLocal()
     try:
         pending_requests = get_cached_nuove_richieste_count(request, db)
         low_stock = (
@@ -247,6 +241,57 @@ def get_cached_role_choices() -> list[RoleEnum]:
     return values
 
 
+def get_cached_manager_dashboard_charts(db) -> tuple[list[dict], list[dict]]:
+    """Grafici della dashboard manager sugli ultimi 30 giorni.
+
+    La chiave include la data odierna, così la finestra scorre a mezzanotte
+    senza attendere la scadenza del TTL.
+    """
+    today = date.today()
+    cache_key = f"{_CACHE_KEY_MANAGER_DASHBOARD_CHARTS}:{today.isoformat()}"
+    cached = _CACHE.get(cache_key)
+    if isinstance(cached, tuple):
+        return cached
+
+    start_date = today - timedelta(days=30)
+    reports_rows = (
+        db.query(Report.date.label("report_date"), func.count(Report.id).label("count"))
+        .filter(Report.date >= start_date)
+        .group_by(Report.date)
+        .order_by(Report.date)
+        .all()
+    )
+    hours_rows = (
+        db.query(
+            func.coalesce(Site.name, Report.site_name_or_code).label("site_name"),
+            func.sum(Report.total_hours).label("hours"),
+        )
+        .outerjoin(Site, Site.id == Report.site_id)
+        .filter(Report.date >= start_date)
+        .group_by("site_name")
+        .order_by(func.sum(Report.total_hours).desc())
+        .all()
+    )
+    charts = (
+        [
+            {"date": row.report_date.isoformat(), "count": row.count}
+            for row in reports_rows
+        ],
+        [
+            {"site_name": row.site_name or "Senza nome", "hours": float(row.hours or 0)}
+            for row in hours_rows
+        ],
+    )
+    _CACHE.set(cache_key, charts, _CACHE_TTL_DASHBOARD_CHARTS)
+    return charts
+
+
+def invalidate_manager_dashboard_charts_cache() -> None:
+    _CACHE.invalidate(
+        f"{_CACHE_KEY_MANAGER_DASHBOARD_CHARTS}:{date.today().isoformat()}"
+    )
+
+
 def invalidate_manager_badges_cache() -> None:
     _CACHE.invalidate(_CACHE_KEY_NUOVE_RICHIESTE)
     _CACHE.invalidate(_CACHE_KEY_MANAGER_BADGES)
@@ -256,6 +301,34 @@ def register_manager_badges(templates) -> None:
     templates.env.globals.setdefault("manager_badge_counts", manager_badge_counts)
 
 
+def _build_bytecode_cache() -> FileSystemBytecodeCache | None:
+    cache_dir = os.getenv("TEMPLATE_BYTECODE_CACHE_DIR", ".jinja_cache")
+    if not cache_dir:
+        return None
+    os.makedirs(cache_dir, exist_ok=True)
+    return FileSystemBytecodeCache(cache_dir)
+
+
+# Un solo Environment per tutta l'app: ogni template viene compilato una volta
+# per processo (il bytecode su disco sopravvive anche ai riavvii) e la cache
+# in memoria e' condivisa fra i router. Stesse opzioni di Jinja2Templates
+# (directory=...); in produzione TEMPLATE_AUTO_RELOAD=0 evita lo stat del
+# sorgente a ogni render.
+TEMPLATE_ENV = Environment(
+    loader=FileSystemLoader("templates"),
+    autoescape=select_autoescape(),
+    auto_reload=os.getenv("TEMPLATE_AUTO_RELOAD", "1") != "0",
+    cache_size=400,
+    bytecode_cache=_build_bytecode_cache(),
+)
+
+
+def warm_template_cache(template_names) -> None:
+    """Compila in anticipo i template indicati nella cache di TEMPLATE_ENV."""
+    for template_name in template_names:
+        TEMPLATE_ENV.get_template(template_name)
+
+
 def register_permission_helpers(templates) -> None:
     templates.env.globals.setdefault("has_perm", has_perm)
 
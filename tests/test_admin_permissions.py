@@ -11,6 +11,9 @@ from models import RoleEnum
 class AdminPermissionsTests(unittest.TestCase):
     def setUp(self) -> None:
         self.client = TestClient(app)
+        # Il context manager esegue il lifespan (tabelle e admin iniziale).
+        self.client.__enter__()
+        self.addCleanup(self.client.__exit__, None, None, None)
 
     def tearDown(self) -> None:
         app.dependency_overrides = {}
@@ -0,0 +1,137 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from auth import (
+    _CURRENT_USER_CACHE,
+    _INVALID_TOKEN_CACHE,
+    _PASSWORD_VERIFY_CACHE,
+    _get_user_for_token,
+    _token_digest,
+    create_access_token,
+    hash_password,
+    invalidate_current_user_cache,
+    verify_password,
+)
+from database import Base
+from models import RoleEnum, User
+
+
+class CurrentUserCacheTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = create_engine(
+            "sqlite://",
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+        )
+        cls.SessionLocal = sessionmaker(
+            autocommit=False, autoflush=False, bind=cls.engine
+        )
+        Base.metadata.create_all(bind=cls.engine)
+
+    @classmethod
+    def tearDownClass(cls):
+        Base.metadata.drop_all(bind=cls.engine)
+
+    def setUp(self):
+        Base.metadata.drop_all(bind=self.engine)
+        Base.metadata.create_all(bind=self.engine)
+        invalidate_current_user_cache()
+
+    def _add_user(self, db, email="manager@example.com"):
+        user = User(
+            email=email,
+            full_name="Manager",
+            hashed_password=hash_password("password"),
+            role=RoleEnum.manager,
+            is_active=True,
+        )
+        db.add(user)
+        db.commit()
+        return user
+
+    def test_cached_user_is_detached_and_keyed_by_digest(self):
+        db = self.SessionLocal()
+        try:
+            self._add_user(db)
+            token = create_access_token({"sub": "manager@example.com"})
+
+            user = asyncio.run(_get_user_for_token(db, token))
+            self.assertIsNotNone(user)
+            self.assertNotIn(user, db)
+            self.assertIs(_CURRENT_USER_CACHE.get(_token_digest(token)), user)
+            self.assertIsNone(_CURRENT_USER_CACHE.get(token))
+        finally:
+            db.close()
+
+    def test_invalidation_reloads_the_user(self):
+        db = self.SessionLocal()
+        try:
+            self._add_user(db)
+            token = create_access_token({"sub": "manager@example.com"})
+            asyncio.run(_get_user_for_token(db, token))
+
+            stored = db.query(User).filter_by(email="manager@example.com").one()
+            stored.role = RoleEnum.caposquadra
+            db.commit()
+            invalidate_current_user_cache()
+
+            reloaded = asyncio.run(_get_user_for_token(db, token))
+            self.assertEqual(reloaded.role, RoleEnum.caposquadra)
+
+            db.delete(stored)
+            db.commit()
+            invalidate_current_user_cache()
+            self.assertIsNone(asyncio.run(_get_user_for_token(db, token)))
+        finally:
+            db.close()
+
+    def test_cache_is_bounded(self):
+        db = self.SessionLocal()
+        try:
+            self._add_user(db)
+            with mock.patch.object(_CURRENT_USER_CACHE, "_max_entries", 3):
+                for index in range(5):
+                    token = create_access_token(
+                        {"sub": "manager@example.com", "n": index}
+                    )
+                    self.assertIsNotNone(
+                        asyncio.run(_get_user_for_token(db, token))
+                    )
+                self.assertEqual(len(_CURRENT_USER_CACHE._data), 3)
+        finally:
+            db.close()
+
+    def test_invalid_token_is_rejected(self):
+        db = self.SessionLocal()
+        try:
+            self.assertIsNone(asyncio.run(_get_user_for_token(db, "not-a-jwt")))
+            self.assertTrue(_INVALID_TOKEN_CACHE.get(_token_digest("not-a-jwt")))
+            self.assertIsNone(asyncio.run(_get_user_for_token(db, "not-a-jwt")))
+        finally:
+            db.close()
+
+
+class PasswordVerifyCacheTests(unittest.TestCase):
+    def setUp(self):
+        _PASSWORD_VERIFY_CACHE.clear()
+
+    def test_only_successful_verifications_are_cached(self):
+        hashed = hash_password("segreta")
+
+        self.assertFalse(verify_password("sbagliata", hashed))
+        self.assertTrue(verify_password("segreta", hashed))
+        self.assertEqual(len(_PASSWORD_VERIFY_CACHE._data), 1)
+
+        self.assertTrue(verify_password("segreta", hashed))
+        self.assertFalse(verify_password("sbagliata", hashed))
+        self.assertFalse(verify_password("segreta", hash_password("altra")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+from unittest import mock
+
+from cache_utils import TTLCache
+
+
+class TTLCacheTests(unittest.TestCase):
+    def test_full_cache_evicts_least_recently_used(self):
+        cache = TTLCache(max_entries=2)
+        cache.set("a", 1, 60)
+        cache.set("b", 2, 60)
+        self.assertEqual(cache.get("a"), 1)
+
+        cache.set("c", 3, 60)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_expired_entries_are_swept(self):
+        cache = TTLCache(max_entries=3)
+        with mock.patch("cache_utils.time.monotonic", return_value=100.0):
+            cache.set("old", 1, 1)
+        with mock.patch("cache_utils.time.monotonic", return_value=200.0):
+            cache.set("a", 2, 60)
+            cache.set("b", 3, 60)
+
+        self.assertEqual(list(cache._data), ["a", "b"])
+
+    def test_unbounded_cache_keeps_every_key(self):
+        cache = TTLCache()
+        for index in range(10):
+            cache.set(str(index), index, 60)
+        self.assertEqual(len(cache._data), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import unittest
+from datetime import date, datetime
+from types import SimpleNamespace
+from unittest import mock
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from starlette.requests import Request
+
+from database import Base
+from models import Report, RoleEnum, Site, User
+from routers import reports
+
+
+def build_request(if_none_match: str | None = None) -> Request:
+    headers = [(b"host", b"testserver"), (b"cookie", b"lang=it")]
+    if if_none_match is not None:
+        headers.append((b"if-none-match", if_none_match.encode()))
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/manager/rapportini",
+        "query_string": b"",
+        "headers": headers,
+        "scheme": "http",
+        "server": ("testserver", 80),
+    }
+    return Request(scope)
+
+
+class ManagerReportsListQueryTests(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine(
+            "sqlite://",
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+        )
+        self.SessionLocal = sessionmaker(
+            autocommit=False, autoflush=False, bind=self.engine
+        )
+        Base.metadata.create_all(bind=self.engine)
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        self.addCleanup(
+            event.remove, self.engine, "before_cursor_execute", self._record
+        )
+
+        # Badge e notifiche usano la sessione globale: fuori dal conteggio.
+        patcher = mock.patch.object(
+            reports,
+            "build_template_context",
+            lambda request, user, **ctx: ctx,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(
+            reports.templates,
+            "TemplateResponse",
+            side_effect=lambda name, context, **kwargs: context,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def _seed_reports(self, first: int, count: int) -> None:
+        db = self.SessionLocal()
+        try:
+            for index in range(first, first + count):
+                author = User(
+                    email=f"capo{index}@example.com",
+                    full_name=f"Capo {index}",
+                    hashed_password="x",
+                    role=RoleEnum.caposquadra,
+                    is_active=True,
+                )
+                site = Site(name=f"Cantiere {index}", code=f"S-{index}")
+                db.add_all([author, site])
+                db.flush()
+                db.add(
+                    Report(
+                        date=date(2025, 1, index + 1),
+                        site_id=site.id,
+                        site_name_or_code=site.code,
+                        created_by_id=author.id,
+                    )
+                )
+            db.commit()
+        finally:
+            db.close()
+
+    def _list_reports(self, if_none_match: str | None = None):
+        manager = SimpleNamespace(
+            id=1,
+            role=RoleEnum.manager,
+            updated_at=datetime(2025, 1, 1),
+        )
+        db = self.SessionLocal()
+        try:
+            self.statements.clear()
+            context = reports.manager_reports_list(
+                request=build_request(if_none_match),
+                start_date=None,
+                end_date=None,
+                site_id=None,
+                created_by=None,
+                page=1,
+                per_page=20,
+                db=db,
+                current_user=manager,
+            )
+            return context, len(self.statements)
+        finally:
+            db.close()
+
+    def test_query_count_does_not_grow_with_reports(self):
+        self._seed_reports(0, 1)
+        _, queries_with_one = self._list_reports()
+        self._seed_reports(1, 9)
+        context, queries_with_ten = self._list_reports()
+
+        self.assertEqual(queries_with_one, queries_with_ten)
+        self.assertEqual(len(context["reports"]), 10)
+        first = context["reports"][0]
+        self.assertEqual(first.site_name, "Cantiere 9")
+        self.assertEqual(first.created_by_name, "Capo 9")
+
+    def test_conditional_hit_costs_one_query(self):
+        self._seed_reports(0, 3)
+        with mock.patch.object(
+            reports.templates,
+            "TemplateResponse",
+            side_effect=lambda name, context, **kwargs: kwargs["headers"],
+        ):
+            headers, _ = self._list_reports()
+            response, queries = self._list_reports(headers["ETag"])
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(queries, 1)
+
+        self._seed_reports(3, 1)
+        with mock.patch.object(
+            reports.templates,
+            "TemplateResponse",
+            side_effect=lambda name, context, **kwargs: kwargs["headers"],
+        ):
+            headers_after_insert, _ = self._list_reports(headers["ETag"])
+        self.assertNotEqual(headers_after_insert["ETag"], headers["ETag"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -66,6 +66,9 @@ class CaposquadraSitePermissionTests(unittest.TestCase):
             with self.assertRaises(HTTPException) as context:
                 get_site_for_user(db, site.id, capo)
             self.assertEqual(context.exception.status_code, 403)
+            with self.assertRaises(HTTPException) as context:
+                get_site_for_user(db, site.id + 1000, capo)
+            self.assertEqual(context.exception.status_code, 404)
         finally:
             db.close()
 
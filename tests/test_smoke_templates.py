@@ -7,7 +7,7 @@ from types import SimpleNamespace
 from starlette.requests import Request
 
 from main import _build_sites_map_data, app, templates
-from models import RoleEnum, Site, SiteStatusEnum, User
+from models import RoleEnum, Site, SiteStatusEnum
 
 
 def build_request(path: str) -> Request:
@@ -142,26 +142,24 @@ def test_cantiere_form_edit_renders() -> None:
 
 
 def test_cantieri_map_data_is_json_serializable() -> None:
-    site = Site(
-        id=2,
-        name="Cantiere Lyon",
-        code="LY-001",
-        city="Lyon",
-        country="France",
-        address="Rue Exemple 10",
-        lat=45.75,
-        lng=4.85,
-        status=SiteStatusEnum.aperto,
-        is_active=True,
-    )
-    site.caposquadra = User(
-        email="capo@lenta.fr",
-        full_name="Capo Lyon",
-        hashed_password="fake",
-        role=RoleEnum.caposquadra,
-    )
+    row = {
+        "id": 2,
+        "name": "Cantiere Lyon",
+        "address": "Rue Exemple 10",
+        "city": "Lyon",
+        "country": "France",
+        "lat": 45.75,
+        "lng": 4.85,
+        "status": SiteStatusEnum.aperto,
+        "is_active": True,
+        "caposquadra_id": 7,
+        "caposquadra_full_name": "Capo Lyon",
+        "caposquadra_email": "capo@lenta.fr",
+    }
 
-    payload = _build_sites_map_data([site])
+    payload = _build_sites_map_data([row])
     serialized = json.dumps(payload)
 
     assert '"name": "Cantiere Lyon"' in serialized
+    assert payload[0]["caposquadra_name"] == "Capo Lyon"
+    assert payload[0]["address"] == "Rue Exemple 10, Lyon, France"
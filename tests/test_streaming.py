@@ -0,0 +1,172 @@
+import json
+import unittest
+from datetime import date
+from types import SimpleNamespace
+from typing import List
+from unittest import mock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import streaming
+from auth import get_current_active_user
+from database import Base, get_read_db
+from models import Fiche, FicheTypeEnum, Machine, Report, RoleEnum, Site, User
+from routers import fiches, reports
+from schemas import FicheListItem
+
+
+class StreamedListTests(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine(
+            "sqlite://",
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+        )
+        self.SessionLocal = sessionmaker(
+            autocommit=False, autoflush=False, bind=engine
+        )
+        Base.metadata.create_all(bind=engine)
+        self._seed()
+
+        # Blocchi piccoli: lo stream attraversa piu' blocchi anche con pochi dati.
+        for target, name, value in (
+            (streaming, "ReadSessionLocal", self.SessionLocal),
+            (streaming, "STREAM_BATCH_SIZE", 2),
+        ):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.app = FastAPI()
+        self.app.include_router(reports.router)
+        self.app.include_router(fiches.router)
+        self._add_non_streamed_routes()
+
+        def override_db():
+            db = self.SessionLocal()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        manager = SimpleNamespace(id=1, role=RoleEnum.manager, is_active=True)
+        self.app.dependency_overrides[get_read_db] = override_db
+        self.app.dependency_overrides[get_current_active_user] = lambda: manager
+        self.client = TestClient(self.app)
+
+    def _seed(self):
+        db = self.SessionLocal()
+        try:
+            author = User(
+                email="capo@example.com",
+                full_name="Capo",
+                hashed_password="x",
+                role=RoleEnum.caposquadra,
+                is_active=True,
+            )
+            site = Site(name="Cantiere", code="C-1")
+            machine = Machine(name="Escavatore")
+            db.add_all([author, site, machine])
+            db.flush()
+            for index in range(5):
+                db.add(
+                    Report(
+                        date=date(2025, 1, index + 1),
+                        site_id=site.id,
+                        site_name_or_code=site.code,
+                        total_hours=8.5,
+                        created_by_id=author.id,
+                    )
+                )
+                db.add(
+                    Fiche(
+                        date=date(2025, 2, index + 1),
+                        site_id=site.id,
+                        machine_id=machine.id if index % 2 else None,
+                        created_by_id=author.id,
+                        fiche_type=FicheTypeEnum.produzione,
+                        description=f"Fiche {index}",
+                        hours=float(index),
+                    )
+                )
+            db.commit()
+        finally:
+            db.close()
+
+    def _add_non_streamed_routes(self):
+        # Stesse liste servite come prima dello streaming: .all() e
+        # serializzazione tramite response_model.
+        @self.app.get("/old/reports", response_model=List[reports.ReportOut])
+        def old_reports():
+            db = self.SessionLocal()
+            try:
+                rows = db.query(Report).order_by(
+                    Report.date.desc(), Report.id.desc()
+                )
+                return [reports._report_out(row) for row in rows.all()]
+            finally:
+                db.close()
+
+        @self.app.get("/old/fiches", response_model=list[FicheListItem])
+        def old_fiches():
+            db = self.SessionLocal()
+            try:
+                rows = db.query(Fiche).order_by(Fiche.date.desc(), Fiche.id.desc())
+                return [fiches._fiche_list_item(row) for row in rows.all()]
+            finally:
+                db.close()
+
+    def test_streamed_lists_match_non_streamed_output(self):
+        for streamed_path, old_path in (
+            ("/reports", "/old/reports"),
+            ("/fiches/", "/old/fiches"),
+        ):
+            with self.subTest(path=streamed_path):
+                streamed = self.client.get(streamed_path)
+                self.assertEqual(streamed.status_code, 200)
+                body = json.loads(streamed.content)
+                self.assertEqual(len(body), 5)
+                self.assertEqual(body, self.client.get(old_path).json())
+
+    def test_empty_list_is_valid_json(self):
+        db = self.SessionLocal()
+        try:
+            db.query(Report).delete()
+            db.commit()
+        finally:
+            db.close()
+        response = self.client.get("/reports")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), [])
+
+    def test_error_in_first_batch_is_a_500(self):
+        client = TestClient(self.app, raise_server_exceptions=False)
+        with mock.patch.object(
+            reports, "_report_out", side_effect=RuntimeError("boom")
+        ):
+            response = client.get("/reports")
+        self.assertEqual(response.status_code, 500)
+
+    def test_error_mid_stream_is_logged_and_raised(self):
+        calls = {"count": 0}
+        original = reports._report_out
+
+        def failing_after_first_batch(row):
+            calls["count"] += 1
+            if calls["count"] > 2:
+                raise RuntimeError("boom")
+            return original(row)
+
+        with mock.patch.object(
+            reports, "_report_out", side_effect=failing_after_first_batch
+        ), self.assertLogs(streaming.logger, level="ERROR"):
+            with self.assertRaises(RuntimeError):
+                self.client.get("/reports")
+
+
+if __name__ == "__main__":
+    unittest.main()